@@ -0,0 +1,69 @@
+"""
+bench_ranking.py
+Throughput of the batch rank/unrank kernels in pancake_batch against the
+one-stack-at-a-time functions in pancake_ranking, for every stack size.
+
+Run from the repository root:
+    python benchmarks/bench_ranking.py [--batch 1000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pancake_batch import rank_batch, unrank_batch
+from pancake_ranking import rank, state_count, unrank
+
+
+def rate(count, seconds):
+    """ Stacks per second, in millions. """
+
+    return count / seconds / 1e6
+
+
+def bench(stack_size, burnt, batch, scalar_sample, rng):
+    ranks = rng.integers(0, state_count(stack_size, burnt), size=batch, dtype=np.int64)
+
+    start = time.perf_counter()
+    orders = unrank_batch(ranks, stack_size, burnt)
+    unrank_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ranked = rank_batch(orders, burnt)
+    rank_time = time.perf_counter() - start
+    assert (ranked == ranks).all()
+
+    start = time.perf_counter()
+    for index in ranks[:scalar_sample].tolist():
+        rank(unrank(index, stack_size, burnt), burnt)
+    scalar_time = time.perf_counter() - start
+
+    return rate(batch, unrank_time), rate(batch, rank_time), rate(scalar_sample, scalar_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch rank/unrank.")
+    parser.add_argument("--batch", type=int, default=1000000, help="stacks per call")
+    parser.add_argument("--scalar", type=int, default=20000, help="stacks for the scalar baseline")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print("variant   n   unrank M/s   rank M/s   scalar round trip M/s")
+    for burnt in (False, True):
+        for stack_size in range(1 if burnt else 2, 13):
+            unrank_rate, rank_rate, scalar_rate = bench(
+                stack_size, burnt, args.batch, args.scalar, rng
+            )
+            print("{:8} {:2}   {:10.2f}   {:8.2f}   {:21.3f}".format(
+                "burnt" if burnt else "regular", stack_size,
+                unrank_rate, rank_rate, scalar_rate
+            ))
+
+if __name__ == "__main__":
+    main()
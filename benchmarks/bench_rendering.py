@@ -0,0 +1,213 @@
+"""
+bench_rendering.py
+Rendering cost of the game without a screen or a player: runs Game under
+the SDL dummy video driver, replays scripted clicks for every stack size
+and both variants, with the info screens open and closed, and reports
+frames per second, time per phase and allocations per frame as JSON.
+
+Run from the repository root:
+    python benchmarks/bench_rendering.py --output before.json
+    python benchmarks/bench_rendering.py --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pancake_engine import MAX_STACK, MIN_STACK, GameEngine
+from pancake_flipping import SCREEN_HEIGHT, SCREEN_WIDTH, Game
+from pancake_frames import PHASES, FrameTimer
+
+CLICK_EVERY = 10        # Frames between scripted clicks
+WARMUP_FRAMES = 30      # Untimed frames before measuring each scenario
+NOISE_FLOOR_MS = 0.05   # Phases faster than this are not compared
+
+
+# --- Scripted clicks ---
+def pancake_point(game, loc):
+    """ Screen position of the top side of the Pancake at loc. """
+
+    return (SCREEN_WIDTH // 2, (SCREEN_HEIGHT - 50) - 30 * (game.stack_size - loc) + 5)
+
+
+def next_click(game, frame, info, rng):
+    """ Where to click on this frame, or None. With info, keep the info
+        screens open and page through them; otherwise click a random
+        Pancake.
+    """
+
+    if frame % CLICK_EVERY:
+        return None
+    if info:
+        if not game.show_info:
+            return game.button_list[4].rect.center      # Teach me
+        return game.info_button_list[1].rect.center     # Next
+    return pancake_point(game, rng.randrange(game.stack_size))
+
+
+def post_click(point):
+    pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=point, button=1))
+
+
+# --- Measurement ---
+def run_scenario(screen, font, stack_size, burnt, info, frames, alloc_frames, seed):
+    """ Play one scripted scenario and return its measurements. The
+        timed frames and the frames traced for allocations are run
+        separately, so tracing does not slow the timings.
+    """
+
+    rng = random.Random(seed)
+    game = Game(stack_size, burnt, font, GameEngine(stack_size, burnt, rng=random.Random(seed)))
+
+    def frame(i, timer):
+        point = next_click(game, i, info, rng)
+        if point is not None:
+            post_click(point)
+        timer.time("process_events", game.process_events)
+        timer.time("run_logic", game.run_logic)
+        timer.time("display_frame", game.display_frame, screen, font)
+        timer.end_frame()
+
+    scratch = FrameTimer(size=1)
+    for i in range(WARMUP_FRAMES):
+        frame(i, scratch)
+    timer = FrameTimer(size=frames + 1)
+    start = time.perf_counter()
+    for i in range(WARMUP_FRAMES, WARMUP_FRAMES + frames):
+        frame(i, timer)
+    elapsed = time.perf_counter() - start
+
+    # Allocations: the peak of traced memory above where each frame began
+    allocated = []
+    tracemalloc.start()
+    for i in range(WARMUP_FRAMES + frames, WARMUP_FRAMES + frames + alloc_frames):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        frame(i, scratch)
+        allocated.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    phases = {}
+    for phase in PHASES:
+        times = timer.recent(phase)[:frames]
+        phases[phase] = {
+            "mean_ms": 1000 * sum(times) / len(times),
+            "p50_ms": 1000 * sorted(times)[len(times) // 2],
+            "p99_ms": 1000 * timer.percentile(phase, 99),
+        }
+    return {
+        "variant": "burned" if burnt else "regular",
+        "stack_size": stack_size,
+        "info": info,
+        "frames": frames,
+        "fps": frames / elapsed,
+        "phases": phases,
+        "alloc_bytes_per_frame": sum(allocated) / len(allocated) if allocated else None,
+    }
+
+
+def run_suite(frames, alloc_frames, seed, sizes=None):
+    pygame.init()
+    screen = pygame.display.set_mode([SCREEN_WIDTH, SCREEN_HEIGHT])
+    font = pygame.font.SysFont("calibri", 20, bold=True)
+
+    results = []
+    for burnt in (False, True):
+        for stack_size in sizes or range(MIN_STACK[burnt], MAX_STACK + 1):
+            if stack_size < MIN_STACK[burnt]:
+                continue
+            for info in (False, True):
+                results.append(run_scenario(
+                    screen, font, stack_size, burnt, info, frames, alloc_frames, seed
+                ))
+    pygame.quit()
+
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "sdl": ".".join(str(i) for i in pygame.get_sdl_version()),
+            "machine": platform.machine(),
+            "frames": frames,
+            "alloc_frames": alloc_frames,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+# --- Comparing reports ---
+def scenario_key(result):
+    return (result["variant"], result["stack_size"], result["info"])
+
+
+def compare(baseline, report, tolerance):
+    """ Print each scenario's change against a baseline report and
+        return the scenarios that got slower by more than tolerance.
+    """
+
+    before = {scenario_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = scenario_key(result)
+        if key not in before:
+            continue
+        old = before[key]
+        changes = {"fps": result["fps"] / old["fps"] - 1}
+        for phase in PHASES:
+            old_ms = old["phases"][phase]["p50_ms"]
+            if old_ms >= NOISE_FLOOR_MS:
+                changes[phase] = result["phases"][phase]["p50_ms"] / old_ms - 1
+        slower = changes["fps"] < -tolerance or any(
+            changes.get(phase, 0) > tolerance for phase in PHASES
+        )
+        print("{:8} {:2} {:5}  fps {:+6.1%}  ".format(
+            key[0], key[1], "info" if key[2] else "play", changes["fps"]
+        ) + "  ".join(
+            "{} {:+6.1%}".format(phase, changes[phase]) for phase in PHASES if phase in changes
+        ) + ("  REGRESSION" if slower else ""))
+        if slower:
+            regressions.append(key)
+    return regressions
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark game rendering headlessly.")
+    parser.add_argument("--frames", type=int, default=300, help="timed frames per scenario")
+    parser.add_argument("--alloc-frames", type=int, default=50, help="traced frames per scenario")
+    parser.add_argument("--sizes", type=int, nargs="*", help="stack sizes (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="slowdown that counts as a regression (default 10%%)")
+    args = parser.parse_args()
+
+    report = run_suite(args.frames, args.alloc_frames, args.seed, args.sizes)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    elif not args.compare:
+        print(json.dumps(report, indent=1))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
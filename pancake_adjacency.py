@@ -0,0 +1,135 @@
+"""
+pancake_adjacency.py
+Precomputed neighbour tables for small pancake graphs, so that searches
+over ranks find the neighbours of a stack by indexing instead of
+unranking, flipping and ranking it.
+"""
+
+import os
+from array import array
+
+from pancake_ranking import flip, rank, state_count, unrank
+from pancake_shared import attach_or_publish, unpublish
+
+ADJACENCY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "adjacency")
+ADJACENCY_MAGIC = b"PAJ1"
+HEADER_SIZE = 8
+
+# Sizes small enough to tabulate: n! * (n-1) or n! * 2^n * n entries
+LARGEST = {False: 9, True: 7}
+
+# Tables that are already open, keyed by (stack_size, burnt, directory)
+_open_adjacency = {}
+
+
+# --- Classes ---
+class AdjacencyTable:
+    """ This class holds, for every rank, the ranks of its neighbours:
+        row i lists the stack reached from rank i by flipping
+        first_flip, first_flip + 1, ..., n pancakes. Entries use the
+        smallest unsigned integer type that fits every rank.
+    """
+
+    def __init__(self, stack_size, burnt):
+        self.stack_size = stack_size
+        self.burnt = burnt
+        self.size = state_count(stack_size, burnt)
+        self.first_flip = 1 if burnt else 2
+        self.degree = stack_size - self.first_flip + 1
+        self.typecode = "H" if self.size <= 1 << 16 else "I"
+        self.data = None
+
+    def build(self):
+        """ Fill in every row. This touches every permutation once; the
+            searches that use the table never touch one again.
+        """
+
+        self.data = array(self.typecode)
+        for index in range(self.size):
+            order = unrank(index, self.stack_size, self.burnt)
+            for n_to_flip in range(self.first_flip, self.stack_size + 1):
+                self.data.append(rank(flip(order, n_to_flip, self.burnt), self.burnt))
+
+    def neighbors(self, index):
+        """ Return [(n_to_flip, rank), ...] for every flip of a rank. """
+
+        row = index * self.degree
+        return list(zip(
+            range(self.first_flip, self.stack_size + 1),
+            self.data[row:row + self.degree]
+        ))
+
+    def neighbor(self, index, n_to_flip):
+        return self.data[index * self.degree + n_to_flip - self.first_flip]
+
+    def filename(self):
+        variant = "burned" if self.burnt else "regular"
+        return variant + "-n" + str(self.stack_size) + ".adj"
+
+    def save(self, directory=ADJACENCY_DIR):
+        """ Write the rows behind an 8-byte header. """
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename())
+        unpublish(path)
+        with open(path, "wb") as f:
+            f.write(ADJACENCY_MAGIC)
+            f.write(bytes([self.stack_size, int(self.burnt), ord(self.typecode), 0]))
+            f.write(self.data.tobytes())
+
+    def use(self, data, source):
+        """ Read rows from data, a saved table including its header,
+            without copying it.
+        """
+
+        if (data[:4] != ADJACENCY_MAGIC or data[4] != self.stack_size
+            or data[5] != int(self.burnt) or data[6] != ord(self.typecode)):
+            raise ValueError(str(source) + " is not an adjacency table for this stack")
+        self.data = memoryview(data)[HEADER_SIZE:].cast(self.typecode)
+
+
+# --- Functions ---
+def open_adjacency(stack_size, burnt, directory=ADJACENCY_DIR):
+    """ Return the saved adjacency table for this size and variant,
+        attached from shared memory, or None if it has not been built.
+    """
+
+    key = (stack_size, burnt, directory)
+    if key not in _open_adjacency:
+        table = AdjacencyTable(stack_size, burnt)
+        data = attach_or_publish(os.path.join(directory, table.filename()))
+        if data is not None:
+            table.use(data, "shared " + table.filename())
+        _open_adjacency[key] = table if data is not None else None
+    return _open_adjacency[key]
+
+
+def neighbor_ranks(index, stack_size, burnt, adjacency=None):
+    """ Return [(n_to_flip, rank), ...] for every flip of a rank, from
+        the adjacency table if given, otherwise by flipping.
+    """
+
+    if adjacency is not None:
+        return adjacency.neighbors(index)
+    order = unrank(index, stack_size, burnt)
+    return [
+        (n_to_flip, rank(flip(order, n_to_flip, burnt), burnt))
+        for n_to_flip in range(1 if burnt else 2, stack_size + 1)
+    ]
+
+
+# --- Main function ---
+def main():
+    """ Build and save every adjacency table small enough to keep. """
+
+    for burnt in (False, True):
+        for stack_size in range(1 if burnt else 2, LARGEST[burnt] + 1):
+            table = AdjacencyTable(stack_size, burnt)
+            if os.path.exists(os.path.join(ADJACENCY_DIR, table.filename())):
+                continue
+            table.build()
+            table.save()
+            print(table.filename(), len(table.data) * table.data.itemsize, "bytes")
+
+if __name__ == "__main__":
+    main()
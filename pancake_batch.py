@@ -0,0 +1,225 @@
+"""
+pancake_batch.py
+NumPy kernels that rank, unrank and flip whole batches of stacks at a
+time, and a distance-table builder and a level sweep that use them.
+Needs numpy; the game itself does not.
+"""
+
+import numpy as np
+
+from pancake_ranking import state_count
+
+UNVISITED = 3
+
+
+# --- Kernels ---
+def rank_batch(orders, burnt, burnt_up_negative=True):
+    """ Rank every row of an (m, n) array of stacks, giving the same
+        numbers as pancake_ranking.rank.
+        Game writes a pancake with its burnt side up as a negative
+        number; pass burnt_up_negative=False for stacks written the
+        other way round (positive = burnt side up), and they are ranked
+        as the same stacks.
+    """
+
+    orders = np.asarray(orders, dtype=np.int64)
+    m, n = orders.shape
+    sizes = np.abs(orders)
+    ranks = np.zeros(m, dtype=np.int64)
+
+    # Lehmer code, one position at a time for every row at once
+    for i in range(n - 1):
+        smaller = (sizes[:, i+1:] < sizes[:, i:i+1]).sum(axis=1)
+        ranks = ranks * (n - i) + smaller
+
+    if burnt:
+        up = orders < 0 if burnt_up_negative else orders > 0
+        for i in range(n):
+            ranks = ranks * 2 + up[:, i]
+    return ranks
+
+
+def unrank_batch(ranks, stack_size, burnt, burnt_up_negative=True):
+    """ Inverse of rank_batch: return an (m, n) array of stacks. """
+
+    ranks = np.array(ranks, dtype=np.int64)
+    m, n = len(ranks), stack_size
+
+    if burnt:
+        up = np.empty((m, n), dtype=bool)
+        for i in range(n - 1, -1, -1):
+            up[:, i] = ranks & 1
+            ranks >>= 1
+
+    # Read the Lehmer code back from the mixed-radix number
+    digits = np.empty((m, n), dtype=np.int64)
+    for radix in range(1, n + 1):
+        digits[:, n - radix] = ranks % radix
+        ranks //= radix
+
+    # Decode right to left: the digit of position i is its rank among
+    # positions i..n-1, so the ranks already placed to its right that
+    # are at least as large move up by one
+    orders = digits
+    for i in range(n - 2, -1, -1):
+        orders[:, i+1:] += orders[:, i+1:] >= orders[:, i:i+1]
+    orders += 1
+
+    if burnt:
+        negative = up if burnt_up_negative else ~up
+        orders[negative] *= -1
+    return orders
+
+
+def flip_batch(orders, n_to_flip, burnt):
+    """ Flip the top n_to_flip pancakes of every row. """
+
+    flipped = orders.copy()
+    flipped[:, :n_to_flip] = orders[:, n_to_flip-1::-1]
+    if burnt:
+        flipped[:, :n_to_flip] *= -1
+    return flipped
+
+
+def neighbor_ranks_batch(ranks, stack_size, burnt):
+    """ Return an (m, degree) array of the neighbour ranks of each rank,
+        in the same column order as AdjacencyTable.
+    """
+
+    orders = unrank_batch(ranks, stack_size, burnt)
+    first = 1 if burnt else 2
+    return np.stack([
+        rank_batch(flip_batch(orders, n_to_flip, burnt), burnt)
+        for n_to_flip in range(first, stack_size + 1)
+    ], axis=1)
+
+
+# --- Table builder ---
+class PackedResidues:
+    """ Vectorized reads and writes of a 2-bit-per-rank numpy array, laid
+        out exactly like TwoBitDistanceTable.data.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.packed = np.full((size + 3) // 4, 255, dtype=np.uint8)
+
+    def get(self, ranks):
+        shifts = ((ranks & 3) << 1).astype(np.uint8)
+        return (self.packed[ranks >> 2] >> shifts) & 3
+
+    def get_range(self, start, stop):
+        """ Residues of ranks start..stop-1, with start a multiple of 4. """
+
+        block = self.packed[start >> 2:(stop + 3) >> 2]
+        values = (block[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+        return values.ravel()[:stop - start]
+
+    def set(self, ranks, value):
+        """ Set many ranks at once. Ranks sharing a byte are written in
+            separate passes (one per slot in the byte) so that no
+            update is lost.
+        """
+
+        for slot in range(4):
+            selected = np.unique(ranks[(ranks & 3) == slot] >> 2)
+            shift = slot << 1
+            keep = np.uint8(255 ^ (3 << shift))
+            self.packed[selected] = (self.packed[selected] & keep) | np.uint8(value << shift)
+
+
+def build_table(table, chunk_size=1 << 18):
+    """ Fill in a TwoBitDistanceTable with the same level-by-level BFS
+        as TwoBitDistanceTable.build, but a chunk of ranks at a time
+        through the batch kernels.
+    """
+
+    n, burnt = table.stack_size, table.burnt
+    size = state_count(n, burnt)
+    chunk_size -= chunk_size % 4
+    residues = PackedResidues(size)
+    residues.set(np.array([0]), 0)
+    level_counts = [1]
+    unvisited = size - 1
+
+    depth = 0
+    while unvisited:
+        residue = depth % 3
+        next_residue = (depth + 1) % 3
+        same_residue = sum(level_counts[residue::3])
+
+        new = 0
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            values = residues.get_range(start, stop)
+            if same_residue <= unvisited:
+                # Top down: expand every rank with this residue
+                frontier = np.flatnonzero(values == residue) + start
+                if len(frontier) == 0:
+                    continue
+                neighbors = np.unique(neighbor_ranks_batch(frontier, n, burnt))
+                neighbors = neighbors[residues.get(neighbors) == UNVISITED]
+                residues.set(neighbors, next_residue)
+                new += len(neighbors)
+            else:
+                # Bottom up: find unvisited ranks next to this residue
+                candidates = np.flatnonzero(values == UNVISITED) + start
+                if len(candidates) == 0:
+                    continue
+                neighbors = neighbor_ranks_batch(candidates, n, burnt)
+                found = candidates[(residues.get(neighbors) == residue).any(axis=1)]
+                residues.set(found, next_residue)
+                new += len(found)
+
+        if new == 0:
+            break
+        level_counts.append(new)
+        unvisited -= new
+        depth += 1
+
+    table.data = memoryview(residues.packed)
+    table.offset = 0
+    table.level_counts = level_counts
+    return table
+
+
+# --- Level sweep ---
+def level_counts(stack_size, burnt, adjacency=None, chunk_size=1 << 16):
+    """ Count the stacks at each distance with the same search as
+        LayerSweep.levels: bitsets of the visited stacks and of the
+        last two levels. Each level is expanded a chunk of ranks at a
+        time, with the neighbours read from the adjacency table if
+        given (otherwise from the batch kernels) and ORed into the
+        next level's bitset.
+    """
+
+    size = state_count(stack_size, burnt)
+    if adjacency is not None:
+        rows = np.asarray(adjacency.data).reshape(size, adjacency.degree)
+    visited = np.zeros((size + 7) // 8, dtype=np.uint8)
+    current = visited.copy()
+    visited[0] = current[0] = 1
+    counts = [1]
+
+    while True:
+        following = np.zeros_like(visited)
+        # A chunk of bytes of the bitset is eight ranks a byte
+        for start in range(0, len(current), chunk_size):
+            bits = np.unpackbits(current[start:start + chunk_size], bitorder="little")
+            ranks = np.flatnonzero(bits) + (start << 3)
+            if len(ranks) == 0:
+                continue
+            if adjacency is not None:
+                neighbors = rows[ranks].ravel().astype(np.int64)
+            else:
+                neighbors = neighbor_ranks_batch(ranks, stack_size, burnt).ravel()
+            np.bitwise_or.at(
+                following, neighbors >> 3, np.left_shift(1, neighbors & 7).astype(np.uint8)
+            )
+        following &= ~visited
+        new = int(np.unpackbits(following).sum())
+        if new == 0:
+            return counts
+        visited |= following
+        counts.append(new)
+        current = following
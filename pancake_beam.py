@@ -0,0 +1,149 @@
+"""
+pancake_beam.py
+An anytime solver for stacks too big to solve exactly while the player
+waits: it has a valid flip sequence at once and keeps shortening it for
+as long as it is given time.
+"""
+
+import time
+
+from pancake_relabel import normalise
+from pancake_search import gap_heuristic
+from pancake_strategies import flip_order, gap_greedy
+
+YIELD_EVERY = 64    # States expanded between checks of the time budget
+
+
+# --- Classes ---
+class AnytimeBeamSearch:
+    """ This class improves a flip sequence from start to goal a little
+        at a time. The first sequence comes from playing gap_greedy, so
+        it is there as soon as the object is made. Each later pass is a
+        beam search that keeps the width stacks with the lowest gap
+        heuristic at every depth and discards anything that cannot beat
+        the best sequence so far; the beam doubles after every pass.
+        A pass that never had to drop a stack has searched everything,
+        so its answer is optimal and proven is set.
+        Call improve(budget) as often as there is time to spare.
+    """
+
+    def __init__(self, start, goal, burnt, initial_width=8, max_width=1 << 14,
+                 heuristic=None):
+        self.start = start
+        self.goal = goal
+        self.burnt = burnt
+        self.heuristic = heuristic if heuristic is not None else gap_heuristic
+        self.width = initial_width
+        self.max_width = max_width
+        self.proven = False     # True once best_flips is known to be optimal
+        self.nodes_expanded = 0
+
+        self.order = normalise(start, goal)
+        self.identity = tuple(range(1, len(self.order) + 1))
+        self.best_flips = self.greedy_flips()
+        self._passes = self._beam_passes()
+
+    @property
+    def best_moves(self):
+        return len(self.best_flips)
+
+    def greedy_flips(self):
+        flips = []
+        order = list(self.order)
+        while tuple(order) != self.identity:
+            n_to_flip = gap_greedy(order, self.burnt)
+            order = flip_order(order, n_to_flip, self.burnt)
+            flips.append(n_to_flip)
+        return flips
+
+    def improve(self, budget):
+        """ Search for up to budget seconds. Return True if a shorter
+            sequence was found.
+        """
+
+        deadline = time.perf_counter() + budget
+        improved = False
+        while not self.proven and time.perf_counter() < deadline:
+            try:
+                improved = next(self._passes) or improved
+            except StopIteration:
+                break
+        return improved
+
+    def _beam_passes(self):
+        """ Run beam passes of growing width, yielding every
+            YIELD_EVERY expansions: True when best_flips just got
+            shorter, otherwise False.
+        """
+
+        first = 1 if self.burnt else 2
+        n = len(self.order)
+        while True:
+            start = tuple(self.order)
+            if start == self.identity:
+                self.proven = True
+                return
+
+            seen = {start}
+            layer = [start]
+            parents = []        # Per depth: {stack: (previous stack, n_to_flip)}
+            truncated = False
+            found = False
+            depth = 0
+            while layer and depth + 1 < self.best_moves:
+                children = {}
+                parent_of = {}
+                found = False
+                for count, order in enumerate(layer, 1):
+                    for n_to_flip in range(first, n + 1):
+                        child = tuple(flip_order(list(order), n_to_flip, self.burnt))
+                        if child in seen or child in children:
+                            continue
+                        h = self.heuristic(child, self.burnt)
+                        if depth + 1 + h >= self.best_moves:
+                            continue
+                        children[child] = h
+                        parent_of[child] = (order, n_to_flip)
+                        if child == self.identity:
+                            found = True
+                    self.nodes_expanded += 1
+                    if found:
+                        break
+                    if count % YIELD_EVERY == 0:
+                        yield False
+
+                parents.append(parent_of)
+                if found:
+                    self.best_flips = self.traceback(parents)
+                    break
+
+                if len(children) > self.width:
+                    truncated = True
+                    layer = sorted(children, key=children.get)[:self.width]
+                else:
+                    layer = list(children)
+                seen.update(layer)
+                depth += 1
+
+            if not truncated:
+                # Nothing was dropped, so nothing shorter exists
+                self.proven = True
+                yield found
+                return
+            yield found
+            if self.width >= self.max_width:
+                return
+            self.width *= 2
+
+    def traceback(self, parents):
+        """ Read the flips from start to the sorted stack out of the
+            per-depth parent maps.
+        """
+
+        flips = []
+        order = self.identity
+        for parent_of in reversed(parents):
+            order, n_to_flip = parent_of[order]
+            flips.append(n_to_flip)
+        flips.reverse()
+        return flips
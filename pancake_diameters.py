@@ -0,0 +1,349 @@
+"""
+pancake_diameters.py
+The diameter of the pancake graph, the most flips any stack of n
+pancakes can need: exact where it is known, and otherwise a certified
+lower bound (a stack whose distance was found by an optimal solver) and
+a proven upper bound. The table lives in data/diameters.json, and a
+search for the hardest stacks of a size raises its lower bounds.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from pancake_layers import iter_layer
+from pancake_oracle import BUILD_LIMIT
+from pancake_sampling import make_heuristic
+from pancake_search import HeuristicSearch
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# Exact values up to 17 regular pancakes (https://oeis.org/A058986)
+# and 12 burned ones (https://oeis.org/A078941)
+DIAMETER_FILE = os.path.join(DATA_DIR, "diameters.json")
+HARD_DIR = os.path.join(DATA_DIR, "hard")
+POOL_SIZE = 32          # Hardest stacks kept to mutate
+SEED_ANTIPODES = 64     # Antipodes of a smaller size used as seeds
+CHECKPOINT_EVERY = 30.0
+
+# Tables loaded from (or added to) each diameter file, keyed by path:
+# {"regular": {n: {"lower": ..., "upper": ..., "witness": [...] or None}}, "burned": ...}
+_diameters = {}
+
+
+# --- Table ---
+def load_diameters(path=DIAMETER_FILE):
+    if path not in _diameters:
+        diameters = {"regular": {}, "burned": {}}
+        with open(path) as f:
+            for variant, by_size in json.load(f).items():
+                for stack_size, entry in by_size.items():
+                    diameters[variant][int(stack_size)] = entry
+        _diameters[path] = diameters
+    return _diameters[path]
+
+
+def save_diameters(path=DIAMETER_FILE):
+    with open(path + ".tmp", "w") as f:
+        json.dump(load_diameters(path), f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def diameter_bounds(stack_size, burnt):
+    """ Return (lower, upper) for the diameter, equal when it is known
+        exactly, or None if the table has no entry.
+    """
+
+    entry = load_diameters()["burned" if burnt else "regular"].get(stack_size)
+    if entry is None:
+        return None
+    return entry["lower"], entry["upper"]
+
+
+def diameter_table():
+    """ {n: {"regular": D, "burned": D}} with the upper bounds, which
+        no stack of that size exceeds. The game uses it in place of a
+        literal dict.
+    """
+
+    table = {}
+    for variant, by_size in load_diameters().items():
+        for stack_size, entry in by_size.items():
+            table.setdefault(stack_size, {})[variant] = entry["upper"]
+    return table
+
+
+def upper_bound(stack_size, burnt, smaller=None):
+    """ Best proven upper bound from the general results, given the
+        upper bound smaller for one pancake fewer:
+            regular - (5n + 5) / 3 (Gates and Papadimitriou, 1979)
+            burned  - 2n - 2 for n >= 10 (Cohen and Blum, 1995), 3n
+        and from putting the largest pancake at the bottom first (2
+        flips, or 3 when it must also be turned burnt side down).
+    """
+
+    n = stack_size
+    if burnt:
+        bounds = [2 * n - 2 if n >= 10 else 3 * n]
+        step = 3
+    else:
+        bounds = [(5 * n + 5) // 3]
+        step = 2
+    if smaller is not None:
+        bounds.append(smaller + step)
+    return min(bounds)
+
+
+def record_lower_bound(stack_size, burnt, distance, witness, path=DIAMETER_FILE):
+    """ Enter a stack certified to need distance flips. Return True if
+        it raised the lower bound (or gave a known bound its first
+        witness). A size without an entry gets one, with its upper
+        bound worked out from the size below.
+    """
+
+    variant = "burned" if burnt else "regular"
+    by_size = load_diameters(path)[variant]
+    entry = by_size.get(stack_size)
+    if entry is None:
+        smaller = by_size.get(stack_size - 1)
+        entry = {
+            # One pancake more never makes the hardest stack easier
+            "lower": smaller["lower"] if smaller else 0,
+            "upper": upper_bound(stack_size, burnt, smaller["upper"] if smaller else None),
+            "witness": None,
+        }
+        by_size[stack_size] = entry
+    if distance > entry["upper"]:
+        raise ValueError("a stack of " + str(stack_size) + " cannot need " + str(distance) + " flips")
+    if distance < entry["lower"] or (distance == entry["lower"] and entry["witness"]):
+        return False
+    entry["lower"] = distance
+    entry["witness"] = list(witness)
+    save_diameters(path)
+    return True
+
+
+# --- Candidates ---
+def family_stacks(stack_size, burnt):
+    """ Stacks from families known to be hard: odd pancakes over even
+        ones (a gap at every pancake), and for burnt stacks the sorted
+        stack upside down (-I_n, conjectured hardest by Cohen and Blum).
+    """
+
+    odd = list(range(1, stack_size + 1, 2))
+    even = list(range(2, stack_size + 1, 2))
+    stacks = [odd + even, even + odd]
+    if burnt:
+        stacks = [[-v for v in order] for order in stacks]
+        stacks.append([-v for v in range(1, stack_size + 1)])
+    return stacks
+
+
+def extend(order, stack_size, burnt, rng):
+    """ Add the missing larger pancakes at random places. Removing a
+        pancake from a solution still leaves a solution, so the new
+        stack needs at least as many flips as order.
+    """
+
+    order = list(order)
+    for value in range(len(order) + 1, stack_size + 1):
+        if burnt and rng.random() < 0.5:
+            value = -value
+        order.insert(rng.randrange(len(order) + 1), value)
+    return order
+
+
+def seed_stacks(stack_size, burnt, rng):
+    """ The hard families, plus the hardest known stacks of smaller
+        sizes grown to this one: the witnesses in the table, and the
+        antipodes of the largest size small enough to sweep.
+    """
+
+    seeds = family_stacks(stack_size, burnt)
+    by_size = load_diameters()["burned" if burnt else "regular"]
+    for smaller in range(stack_size - 1, 0, -1):
+        entry = by_size.get(smaller)
+        if entry and entry["witness"]:
+            for i in range(stack_size):
+                seeds.append(extend(entry["witness"], stack_size, burnt, rng))
+    swept = min(stack_size - 1, BUILD_LIMIT[burnt])
+    for order, distance in itertools.islice(iter_layer(swept, burnt), SEED_ANTIPODES):
+        seeds.append(extend(order, stack_size, burnt, rng))
+    return seeds
+
+
+def mutate(order, burnt, rng):
+    """ Swap one or two pairs of pancakes, or turn one over. """
+
+    order = list(order)
+    for i in range(rng.randint(1, 2)):
+        if burnt and rng.random() < 1 / 3:
+            position = rng.randrange(len(order))
+            order[position] = -order[position]
+        else:
+            a, b = rng.sample(range(len(order)), 2)
+            order[a], order[b] = order[b], order[a]
+    return order
+
+
+def certify(job):
+    """ Worker: return (order, exact distance), or (order, None) if
+        order is solved in fewer than at_least flips. The bounded
+        search rules out easy stacks before any exact search runs.
+    """
+
+    order, burnt, at_least = job
+    goal = list(range(1, len(order) + 1))
+    heuristic = make_heuristic(len(order), burnt)
+    if HeuristicSearch(order, goal, burnt, heuristic, max_moves=at_least - 1).search():
+        return order, None
+    solver = HeuristicSearch(order, goal, burnt, heuristic)
+    solver.search()
+    return order, solver.fewest_moves
+
+
+# --- Classes ---
+class HardInstanceSearch:
+    """ This class looks for the stacks of one size that need the most
+        flips. It keeps a pool of the hardest stacks certified so far,
+        starting from seed_stacks, and mutates them; a mutant joins the
+        pool if it needs at least as many flips as the hardest, which a
+        bounded search rules out cheaply for most of them. Every stack
+        in the pool has an exact distance, so the hardest is a proven
+        lower bound on the diameter.
+        State is checkpointed under data/hard/, so a search can be
+        stopped and resumed.
+    """
+
+    def __init__(self, stack_size, burnt, seed=0, pool_size=POOL_SIZE, path=None):
+        self.stack_size = stack_size
+        self.burnt = burnt
+        self.seed = seed
+        self.pool_size = pool_size
+        variant = "burned" if burnt else "regular"
+        self.path = path or os.path.join(HARD_DIR, variant + "-n" + str(stack_size) + ".json")
+        self.best = None        # Distance of the stacks in the pool
+        self.pool = []          # Certified stacks at distance best
+        self.evaluated = 0
+        self.seen = set()
+        self.load()
+        self.rng = random.Random(seed << 32 | self.evaluated)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            saved = json.load(f)
+        if (saved["stack_size"], saved["burnt"]) != (self.stack_size, self.burnt):
+            raise ValueError(self.path + " is a checkpoint of another search")
+        self.best = saved["best"]
+        self.pool = [tuple(order) for order in saved["pool"]]
+        self.evaluated = saved["evaluated"]
+        self.seen.update(self.pool)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        saved = {
+            "stack_size": self.stack_size,
+            "burnt": self.burnt,
+            "best": self.best,
+            "pool": [list(order) for order in self.pool],
+            "evaluated": self.evaluated,
+        }
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(saved, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def candidates(self, count):
+        """ Up to count stacks not yet certified: the seeds while the
+            pool is empty, then mutants of the pool.
+        """
+
+        if not self.pool:
+            stacks = seed_stacks(self.stack_size, self.burnt, self.rng)
+        else:
+            stacks = (mutate(self.rng.choice(self.pool), self.burnt, self.rng)
+                      for i in range(20 * count))
+        fresh = []
+        for order in stacks:
+            key = tuple(order)
+            if key not in self.seen:
+                self.seen.add(key)
+                fresh.append(order)
+                if len(fresh) == count and self.pool:
+                    break
+        return fresh
+
+    def add(self, order, distance):
+        """ Keep a certified stack if it is as hard as the hardest. """
+
+        order = tuple(order)
+        if self.best is None or distance > self.best:
+            self.best = distance
+            self.pool = [order]
+        elif distance == self.best:
+            if len(self.pool) < self.pool_size:
+                self.pool.append(order)
+            else:
+                # A full pool drifts across the plateau
+                self.pool[self.rng.randrange(self.pool_size)] = order
+
+    def run(self, evaluations, processes=None, batch_size=64, checkpoint_every=CHECKPOINT_EVERY):
+        """ Certify up to evaluations more stacks across a process pool,
+            recording every new lower bound in the diameter table. Yield
+            after each batch.
+        """
+
+        if self.burnt:
+            # Build any missing databases here, once, rather than in every worker
+            make_heuristic(self.stack_size, self.burnt)
+        target = self.evaluated + evaluations
+        last_saved = time.monotonic()
+        try:
+            with multiprocessing.Pool(processes) as pool:
+                while self.evaluated < target:
+                    batch = self.candidates(min(batch_size, target - self.evaluated))
+                    if not batch:
+                        break
+                    # Seeds are certified exactly; mutants only if hard enough
+                    at_least = self.best if self.pool else 0
+                    jobs = [(order, self.burnt, at_least) for order in batch]
+                    for order, distance in pool.imap_unordered(certify, jobs):
+                        self.evaluated += 1
+                        if distance is not None:
+                            self.add(order, distance)
+                    record_lower_bound(self.stack_size, self.burnt, self.best, self.pool[0])
+                    if time.monotonic() - last_saved >= checkpoint_every:
+                        self.save()
+                        last_saved = time.monotonic()
+                    yield self
+        finally:
+            self.save()
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="Search for the hardest stacks of a size.")
+    parser.add_argument("stack_size", type=int)
+    parser.add_argument("--burnt", action="store_true")
+    parser.add_argument("--evaluations", type=int, default=2000, help="stacks to certify")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    search = HardInstanceSearch(args.stack_size, args.burnt, args.seed)
+    try:
+        for search in search.run(args.evaluations, args.processes):
+            print(search.evaluated, "certified, hardest", search.best, "flips,",
+                  len(search.pool), "in pool", flush=True)
+    except KeyboardInterrupt:
+        print("Stopped; run again to resume.")
+    lower, upper = diameter_bounds(args.stack_size, args.burnt)
+    print("Diameter", lower if lower == upper else str(lower) + " to " + str(upper),
+          "e.g.", load_diameters()["burned" if args.burnt else "regular"][args.stack_size]["witness"])
+
+if __name__ == "__main__":
+    main()
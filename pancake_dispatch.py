@@ -0,0 +1,349 @@
+"""
+pancake_dispatch.py
+Choose how to solve a dealt stack: estimate what each solver would cost
+on this machine for this stack, and run the cheapest one that fits in
+the latency budget. Every choice is logged, so that the estimates can
+be calibrated against what really happened.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from pancake_oracle import goal_table
+from pancake_ranking import state_count
+from pancake_relabel import normalise
+from pancake_search import HeuristicSearch, gap_heuristic
+from pancake_service import DEFAULT_SOCKET, parse_address, pdb_heuristic, remote_distance
+from pancake_store import open_store
+from pancake_strategies import flip_order
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DISPATCH_LOG = os.path.join(DATA_DIR, "dispatch.jsonl")
+MODEL_FILE = os.path.join(DATA_DIR, "dispatch_model.json")
+LATENCY_BUDGET = 0.05   # Seconds a new stack may take to solve
+LOG_LIMIT = 1 << 20     # Bytes of log kept before it is rotated
+
+# Seconds of fixed overhead, on top of the work, for engines that talk
+# to something else
+OVERHEAD = {"store": 0.0002, "service": 0.002}
+
+# Engines that stop by the clock when their budget runs out
+CLOCKED = ("ida", "pdb", "service")
+
+# Starting model, before any calibration: how much slower than one work
+# unit each engine's unit is, and how far the true distance usually is
+# above the gap heuristic
+DEFAULT_MODEL = {
+    "factors": {"table": 1.0, "store": 1.0, "bfs": 3.0, "ida": 2.0, "pdb": 6.0, "service": 2.0},
+    "slack": {"regular": 1.0, "burned": 2.0},
+}
+
+_seconds_per_unit = None
+
+
+# --- Functions ---
+def seconds_per_unit():
+    """ Measure this machine once: the time to make one neighbour of a
+        stack and score it with the gap heuristic, the step every
+        search repeats.
+    """
+
+    global _seconds_per_unit
+    if _seconds_per_unit is None:
+        order = random.Random(0).sample(range(1, 11), 10)
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 0.005:
+            for n_to_flip in range(2, 11):
+                gap_heuristic(flip_order(order, n_to_flip, False), False)
+            count += 9
+        _seconds_per_unit = (time.perf_counter() - start) / count
+    return _seconds_per_unit
+
+
+def variant_name(burnt):
+    return "burned" if burnt else "regular"
+
+
+def load_model(path=MODEL_FILE):
+    model = json.loads(json.dumps(DEFAULT_MODEL))
+    if os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+        for part in model:
+            model[part].update(saved.get(part, {}))
+    return model
+
+
+# --- Classes ---
+class Dispatch:
+    """ What the dispatcher did for one stack. fewest_moves is None when
+        nothing exact fit in the budget (engine is then "approximate").
+    """
+
+    def __init__(self, engine, fewest_moves, seconds, estimates, tried):
+        self.engine = engine
+        self.fewest_moves = fewest_moves
+        self.seconds = seconds
+        self.estimates = estimates      # engine -> estimated seconds
+        self.tried = tried              # engines run, in order
+
+
+class SolverDispatcher:
+    """ This class picks a solver for each stack from a cost model.
+        Each engine estimates its work in units (one neighbour made and
+        scored), and the model turns units into seconds using the
+        speed of this machine and a per-engine factor:
+            table   - walk a distance table downhill (if one is open)
+            store   - look the stack up among stored solutions
+            bfs     - Graph.BFS over the whole graph (graph_class)
+            ida     - HeuristicSearch with the gap heuristic
+            pdb     - HeuristicSearch with the pattern databases, for
+                      burnt stacks whose databases are saved
+            service - ask the local solver service
+        Engines are tried cheapest first while their estimate fits what
+        is left of the budget. store may not know the answer, and a
+        search or the service may run out of budget; then the next
+        engine is tried. The searches and the service stop by the clock,
+        so the cheapest of them gets what is left of the budget even
+        when it is not expected to finish. If none answers, the stack
+        is left to an approximation (see AnytimeBeamSearch).
+        graph_class is passed in, like IdentityCache's solver_class, so
+        this module does not need pygame. Choices are logged when
+        log_path is given; past LOG_LIMIT bytes the log is moved to
+        log_path + ".1" and a new one started, so at most two are kept.
+    """
+
+    def __init__(self, budget=LATENCY_BUDGET, graph_class=None, log_path=None,
+                 model_path=MODEL_FILE):
+        self.budget = budget
+        self.graph_class = graph_class
+        self.log_path = log_path
+        self.model = load_model(model_path)
+        self.unit = seconds_per_unit()
+
+    def work_units(self, order, burnt):
+        """ Return {engine: work units} for every engine that can run
+            on this (normalised) stack.
+        """
+
+        n = len(order)
+        degree = n if burnt else n - 1
+        h = gap_heuristic(order, burnt)
+        expected = h + self.model["slack"][variant_name(burnt)]
+        units = {"store": 1}
+
+        if goal_table(n, burnt, build=False) is not None:
+            units["table"] = expected * degree
+        if self.graph_class is not None:
+            # Graph.BFS runs until the queue is empty: every stack once
+            units["bfs"] = state_count(n, burnt) * degree
+        # IDA* expands about one extra subtree of the branching factor
+        # for each move of slack, on each move of the path
+        units["ida"] = (expected + 1) * degree ** (1 + expected - h)
+        heuristic = pdb_heuristic(n, burnt)
+        if heuristic is not None and heuristic.on_disk():
+            # The same, from the larger pattern database estimate
+            units["pdb"] = (expected + 1) * degree ** (1 + max(0, expected - heuristic(order, burnt)))
+        if self.service_address() is not None:
+            units["service"] = units["ida"]
+        return units
+
+    def service_address(self):
+        address = parse_address(os.environ.get("PANCAKE_SOLVER", DEFAULT_SOCKET))
+        if isinstance(address, str) and not os.path.exists(address):
+            return None
+        return address
+
+    def estimates(self, order, burnt):
+        """ Return ({engine: estimated seconds}, cheapest first, and
+            {engine: work units}).
+        """
+
+        units = self.work_units(order, burnt)
+        seconds = {
+            engine: work * self.unit * self.model["factors"][engine] + OVERHEAD.get(engine, 0)
+            for engine, work in units.items()
+        }
+        return dict(sorted(seconds.items(), key=lambda item: item[1])), units
+
+    def run(self, engine, start, goal, burnt, budget=None):
+        """ Run one engine. Return the fewest moves, or None if the
+            engine does not know. Searches that could overrun give up
+            after the node count their estimate allows, or after budget
+            seconds by the clock, whichever comes first.
+        """
+
+        if engine == "table":
+            return goal_table(len(start), burnt).distance(normalise(start, goal))
+        if engine == "store":
+            flips = open_store().get(normalise(start, goal), burnt)
+            return len(flips) if flips is not None else None
+        if engine == "bfs":
+            graph = self.graph_class(start, goal, burnt)
+            graph.BFS()
+            return graph.fewest_moves
+        if engine in ("ida", "pdb"):
+            heuristic = pdb_heuristic(len(start), burnt) if engine == "pdb" else None
+            node_limit = None
+            if budget is not None:
+                degree = len(start) if burnt else len(start) - 1
+                node_limit = int(budget / (self.unit * self.model["factors"][engine] * degree))
+            solver = HeuristicSearch(
+                start, goal, burnt, heuristic, node_limit=node_limit, time_limit=budget
+            )
+            if not solver.search():
+                return None
+            open_store().put(normalise(start, goal), burnt, solver.flips)
+            return solver.fewest_moves
+        if engine == "service":
+            return remote_distance(start, goal, burnt, self.service_address(), budget)
+        raise ValueError("unknown engine " + str(engine))
+
+    def solve(self, start, goal, burnt):
+        """ Find the fewest moves from start to goal with the cheapest
+            engine that fits the budget, and log the choice.
+        """
+
+        order = normalise(start, goal)
+        estimates, units = self.estimates(order, burnt)
+        began = time.perf_counter()
+        tried = []
+        engine, fewest_moves = "approximate", None
+        long_shot = False
+        for candidate, estimate in estimates.items():
+            remaining = self.budget - (time.perf_counter() - began)
+            if remaining <= 0:
+                break
+            if estimate > remaining:
+                if candidate not in CLOCKED or long_shot:
+                    continue
+                long_shot = True
+            tried.append(candidate)
+            fewest_moves = self.run(candidate, start, goal, burnt, remaining)
+            if fewest_moves is not None:
+                engine = candidate
+                break
+
+        dispatch = Dispatch(engine, fewest_moves, time.perf_counter() - began, estimates, tried)
+        self.record(order, burnt, dispatch, units)
+        return dispatch
+
+    def record(self, order, burnt, dispatch, units):
+        """ Append the choice, the estimates and what it really cost to
+            the log, one JSON object per line.
+        """
+
+        if self.log_path is None:
+            return
+        entry = {
+            "time": time.time(),
+            "stack_size": len(order),
+            "burnt": burnt,
+            "heuristic": gap_heuristic(order, burnt),
+            "engine": dispatch.engine,
+            "seconds": dispatch.seconds,
+            "fewest_moves": dispatch.fewest_moves,
+            "tried": dispatch.tried,
+            "units": units,
+            "seconds_per_unit": self.unit,
+            "estimates": dispatch.estimates,
+        }
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= LOG_LIMIT:
+            os.replace(self.log_path, self.log_path + ".1")
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def calibrate(log_path=DISPATCH_LOG, model_path=MODEL_FILE):
+    """ Fit the model to the log: each engine's factor becomes the
+        median of (real seconds / predicted seconds per factor) over the
+        stacks it answered, and the slack the mean distance above the
+        gap heuristic. The rotated log is read too. Write and return
+        the model.
+    """
+
+    ratios = {}
+    slack = {"regular": [], "burned": []}
+    lines = []
+    for path in (log_path + ".1", log_path):
+        if os.path.exists(path):
+            with open(path) as f:
+                lines.extend(f)
+    for line in lines:
+        entry = json.loads(line)
+        engine = entry["engine"]
+        if entry["fewest_moves"] is not None:
+            slack[variant_name(entry["burnt"])].append(
+                entry["fewest_moves"] - entry["heuristic"]
+            )
+        # Only the engine that answered ran alone, so only its time
+        # says anything about its own cost
+        if (entry["fewest_moves"] is not None and engine in entry["units"]
+            and entry["tried"] == [engine]):
+            predicted = entry["units"][engine] * entry["seconds_per_unit"]
+            work = entry["seconds"] - OVERHEAD.get(engine, 0)
+            if predicted > 0 and work > 0:
+                ratios.setdefault(engine, []).append(work / predicted)
+
+    model = load_model(model_path)
+    for engine, values in ratios.items():
+        model["factors"][engine] = statistics.median(values)
+    for variant, values in slack.items():
+        if values:
+            model["slack"][variant] = statistics.mean(values)
+    with open(model_path, "w") as f:
+        json.dump(model, f, indent=1, sort_keys=True)
+    return model
+
+
+def explore(stacks, sizes, engines, budget, log_path=DISPATCH_LOG):
+    """ Run every engine on random stacks, logging each as if it had
+        been chosen, to give calibrate something to fit.
+    """
+
+    dispatcher = SolverDispatcher(budget, log_path=log_path)
+    for burnt in (False, True):
+        for stack_size in sizes:
+            if stack_size < (1 if burnt else 2):
+                continue
+            for i in range(stacks):
+                start = random.sample(range(1, stack_size + 1), stack_size)
+                if burnt:
+                    start = [v * random.choice((-1, 1)) for v in start]
+                goal = list(range(1, stack_size + 1))
+                for engine in engines:
+                    estimates, units = dispatcher.estimates(start, burnt)
+                    if engine not in estimates or estimates[engine] > budget:
+                        continue
+                    began = time.perf_counter()
+                    fewest_moves = dispatcher.run(engine, start, goal, burnt, budget)
+                    dispatcher.record(start, burnt, Dispatch(
+                        engine, fewest_moves, time.perf_counter() - began, estimates, [engine]
+                    ), units)
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the solver dispatcher.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sample = commands.add_parser("explore", help="time every engine on random stacks")
+    sample.add_argument("--stacks", type=int, default=10, help="stacks per size and variant")
+    sample.add_argument("--sizes", type=int, nargs="*", default=list(range(2, 10)))
+    sample.add_argument("--engines", nargs="*", default=["table", "ida", "pdb"])
+    sample.add_argument("--budget", type=float, default=1.0)
+    commands.add_parser("calibrate", help="fit the model to the log")
+    args = parser.parse_args()
+
+    if args.command == "explore":
+        explore(args.stacks, args.sizes, args.engines, args.budget)
+    else:
+        print(json.dumps(calibrate(), indent=1, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+pancake_distributed.py
+Breadth First Search of a whole pancake graph split across workers, so
+that the distance table never has to fit in one machine. Each worker
+owns a share of the ranks, sends the neighbours of its frontier to their
+owners over sockets during each level, and writes its share to local
+files, which merge into exactly the table TwoBitDistanceTable.build
+makes.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from pancake_adjacency import neighbor_ranks, open_adjacency
+from pancake_ranking import state_count
+from pancake_service import parse_address
+from pancake_tables import UNVISITED, TwoBitDistanceTable
+
+PART_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "distributed")
+PART_MAGIC = b"PDP1"
+PART_HEADER = struct.Struct("<4sBBHHB")    # magic, n, burnt, workers, worker, block bits
+BLOCK_BITS = 12         # Ranks are owned in blocks of 4096 (1 KB of table)
+BATCH_SIZE = 8192       # Ranks per frontier message
+
+# Frontier messages: a header, then count ranks as little-endian uint64
+MESSAGE = struct.Struct("<BIQ")     # kind, level, count
+RANKS = 1
+END = 2                 # The sender has sent everything for this level
+
+# For each residue, the positions in a byte of packed residues that hold it
+MATCHES = [
+    [tuple(position for position in range(4) if (byte >> (position << 1)) & 3 == residue)
+     for byte in range(256)]
+    for residue in range(3)
+]
+
+
+# --- Partition ---
+def block_owner(block, workers):
+    """ The worker that owns a block of ranks. Neighbouring blocks hold
+        similar stacks, found at similar levels, so they are scattered
+        by a multiplicative hash to spread each level's work out.
+    """
+
+    return (((block * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32) % workers
+
+
+def owned_blocks(stack_size, burnt, workers, worker):
+    blocks = (state_count(stack_size, burnt) + (1 << BLOCK_BITS) - 1) >> BLOCK_BITS
+    return [block for block in range(blocks) if block_owner(block, workers) == worker]
+
+
+class Partition:
+    """ This class holds one worker's share of a distance table: the
+        residues of the blocks of ranks it owns, each block packed
+        exactly like the same ranks of TwoBitDistanceTable.data.
+    """
+
+    def __init__(self, stack_size, burnt, workers, worker):
+        self.stack_size = stack_size
+        self.burnt = burnt
+        self.workers = workers
+        self.worker = worker
+        self.size = state_count(stack_size, burnt)
+        self.blocks = {
+            block: bytearray([255]) * self.block_bytes(block)
+            for block in owned_blocks(stack_size, burnt, workers, worker)
+        }
+
+    def block_bytes(self, block):
+        ranks = min(1 << BLOCK_BITS, self.size - (block << BLOCK_BITS))
+        return (ranks + 3) // 4
+
+    def get(self, index):
+        block = self.blocks[index >> BLOCK_BITS]
+        local = index & ((1 << BLOCK_BITS) - 1)
+        return (block[local >> 2] >> ((local & 3) << 1)) & 3
+
+    def set(self, index, value):
+        block = self.blocks[index >> BLOCK_BITS]
+        local = index & ((1 << BLOCK_BITS) - 1)
+        shift = (local & 3) << 1
+        block[local >> 2] = (block[local >> 2] & ~(3 << shift)) | (value << shift)
+
+    def ranks_with(self, residue):
+        """ Yield every owned rank with this residue, a byte of the
+            blocks at a time.
+        """
+
+        matches = MATCHES[residue]
+        for block, data in self.blocks.items():
+            first = block << BLOCK_BITS
+            for i, byte in enumerate(data):
+                for position in matches[byte]:
+                    yield first + (i << 2) + position
+
+    def filename(self):
+        variant = "burned" if self.burnt else "regular"
+        return "{}-n{}-part{}of{}.dist2p".format(
+            variant, self.stack_size, self.worker, self.workers
+        )
+
+    def save(self, directory=PART_DIR):
+        """ Write the owned blocks, in block order, behind a header. """
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename())
+        with open(path, "wb") as f:
+            f.write(PART_HEADER.pack(
+                PART_MAGIC, self.stack_size, int(self.burnt), self.workers, self.worker, BLOCK_BITS
+            ))
+            for block in sorted(self.blocks):
+                f.write(self.blocks[block])
+        return path
+
+
+def merge_parts(stack_size, burnt, workers, directory=PART_DIR):
+    """ Put the saved shares of every worker back together into one
+        TwoBitDistanceTable.
+    """
+
+    size = state_count(stack_size, burnt)
+    data = bytearray([255]) * ((size + 3) // 4)
+    for worker in range(workers):
+        partition = Partition(stack_size, burnt, workers, worker)
+        with open(os.path.join(directory, partition.filename()), "rb") as f:
+            header = PART_HEADER.unpack(f.read(PART_HEADER.size))
+            if header != (PART_MAGIC, stack_size, int(burnt), workers, worker, BLOCK_BITS):
+                raise ValueError(partition.filename() + " is not a share of this table")
+            for block in sorted(partition.blocks):
+                start = block << (BLOCK_BITS - 2)
+                count = partition.block_bytes(block)
+                data[start:start + count] = f.read(count)
+    return TwoBitDistanceTable(stack_size, burnt, data=data)
+
+
+# --- Messages ---
+def send_json(writer, message):
+    writer.write((json.dumps(message) + "\n").encode())
+    writer.flush()
+
+
+def read_json(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    return json.loads(line)
+
+
+def recv_exact(sock, count):
+    """ Read exactly count bytes, or return None if the peer closed the
+        connection first.
+    """
+
+    chunks = []
+    while count:
+        chunk = sock.recv(min(count, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        count -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_ranks(sock, kind, level, ranks=None):
+    if ranks is None:
+        sock.sendall(MESSAGE.pack(kind, level, 0))
+        return
+    if sys.byteorder == "big":
+        ranks = array("Q", ranks)
+        ranks.byteswap()
+    sock.sendall(MESSAGE.pack(kind, level, len(ranks)) + ranks.tobytes())
+
+
+# --- Classes ---
+class BFSWorker:
+    """ One worker of a DistributedBFS. It connects to the coordinator,
+        which assigns its share and gives it the addresses of the other
+        workers, and then for each level:
+        - expands every stack it owns with the residue of that level,
+          found by scanning its blocks as TwoBitDistanceTable.build
+          does, sending each neighbour, in batches, to the worker that
+          owns it, followed by an END marker to every other worker, and
+        - marks every unvisited stack it owns among the neighbours it
+          is sent, with the residue of the next level.
+        A reader thread per incoming connection marks each batch as it
+        arrives, so neither the frontier nor a level's incoming ranks
+        are ever held, and workers sending to each other at once never
+        block.
+    """
+
+    def __init__(self, coordinator, host="127.0.0.1", directory=PART_DIR):
+        self.coordinator = coordinator
+        self.host = host
+        self.directory = directory
+        # Guards the partition and the counts below, which the reader
+        # threads update
+        self.lock = threading.Lock()
+        self.level_done = threading.Condition(self.lock)
+        self.ended = 0          # END markers received for this level
+        self.new = 0            # Stacks marked for the next level
+
+    def owner(self, index):
+        return block_owner(index >> BLOCK_BITS, self.workers)
+
+    def run(self):
+        control = socket.create_connection(self.coordinator)
+        reader = control.makefile("rb")
+        writer = control.makefile("wb")
+        listener = socket.create_server((self.host, 0), backlog=128)
+        send_json(writer, {"address": [self.host, listener.getsockname()[1]]})
+
+        job = read_json(reader)
+        self.worker = job["worker"]
+        self.workers = job["workers"]
+        self.stack_size = job["stack_size"]
+        self.burnt = job["burnt"]
+        self.partition = Partition(self.stack_size, self.burnt, self.workers, self.worker)
+        self.adjacency = open_adjacency(self.stack_size, self.burnt)
+
+        # One connection to each other worker for sending, and one from
+        # each for receiving
+        self.peers = {
+            peer: socket.create_connection(tuple(address))
+            for peer, address in enumerate(job["peers"]) if peer != self.worker
+        }
+        for i in range(self.workers - 1):
+            connection, address = listener.accept()
+            threading.Thread(target=self.receive, args=(connection,), daemon=True).start()
+        listener.close()
+        send_json(writer, {"ready": True})
+
+        if self.owner(0) == self.worker:
+            self.partition.set(0, 0)
+        while True:
+            message = read_json(reader)
+            if "level" in message:
+                new = self.expand(message["level"])
+                send_json(writer, {"level": message["level"], "new": new})
+            else:
+                path = self.partition.save(self.directory)
+                send_json(writer, {"written": path})
+                break
+
+        for sock in self.peers.values():
+            sock.close()
+        control.close()
+
+    def receive(self, sock):
+        """ Reader thread: mark each batch from one other worker, and
+            count its END markers.
+        """
+
+        while True:
+            header = recv_exact(sock, MESSAGE.size)
+            if header is None:
+                sock.close()
+                return
+            kind, level, count = MESSAGE.unpack(header)
+            if kind == END:
+                with self.level_done:
+                    self.ended += 1
+                    self.level_done.notify()
+                continue
+            ranks = array("Q")
+            ranks.frombytes(recv_exact(sock, 8 * count))
+            if sys.byteorder == "big":
+                ranks.byteswap()
+            with self.lock:
+                self.mark(ranks, (level + 1) % 3)
+
+    def mark(self, ranks, residue):
+        """ Give every unvisited rank the residue of the next level. The
+            caller holds the lock.
+        """
+
+        partition = self.partition
+        for index in ranks:
+            if partition.get(index) == UNVISITED:
+                partition.set(index, residue)
+                self.new += 1
+
+    def expand(self, level):
+        """ Run one level and return how many stacks this worker owns at
+            the next one. The stacks with the residue of this level
+            include older levels, whose neighbours are all visited
+            already; stacks marked while the scan runs get the next
+            residue, so it never picks them up.
+        """
+
+        residue = level % 3
+        next_residue = (level + 1) % 3
+        outgoing = [array("Q") for worker in range(self.workers)]
+        for index in self.partition.ranks_with(residue):
+            for n_to_flip, neighbor in neighbor_ranks(
+                index, self.stack_size, self.burnt, self.adjacency
+            ):
+                owner = self.owner(neighbor)
+                batch = outgoing[owner]
+                batch.append(neighbor)
+                if len(batch) >= BATCH_SIZE:
+                    self.deliver(owner, level, batch, next_residue)
+                    outgoing[owner] = array("Q")
+        for owner, batch in enumerate(outgoing):
+            if batch:
+                self.deliver(owner, level, batch, next_residue)
+        for sock in self.peers.values():
+            send_ranks(sock, END, level)
+
+        # Every worker's batches for this level arrive before its END,
+        # and none for the next level until the coordinator starts it
+        with self.level_done:
+            self.level_done.wait_for(lambda: self.ended == self.workers - 1)
+            new = self.new
+            self.ended = 0
+            self.new = 0
+        return new
+
+    def deliver(self, owner, level, batch, residue):
+        if owner == self.worker:
+            with self.lock:
+                self.mark(batch, residue)
+        else:
+            send_ranks(self.peers[owner], RANKS, level, batch)
+
+
+def run_worker(coordinator, host="127.0.0.1", directory=PART_DIR):
+    BFSWorker(coordinator, host, directory).run()
+
+
+class DistributedBFS:
+    """ This class coordinates the workers of a distributed Breadth
+        First Search over ranks. Ranks are owned in blocks scattered
+        over the workers by a hash (see block_owner), and each worker
+        keeps only its own blocks, 2 bits per stack. The coordinator
+        only starts each level and adds up the new stacks, like the
+        level loop of TwoBitDistanceTable.build.
+        With launch, the workers are local processes standing in for
+        machines; otherwise it waits for workers started elsewhere with
+        "python pancake_distributed.py worker HOST:PORT".
+    """
+
+    def __init__(self, stack_size, burnt, workers, host="127.0.0.1", port=0):
+        self.stack_size = stack_size
+        self.burnt = burnt
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.level_counts = []
+        self.paths = []         # Where each worker wrote its share
+
+    def run(self, launch=True, directory=PART_DIR):
+        server = socket.create_server((self.host, self.port), backlog=self.workers)
+        address = (self.host, server.getsockname()[1])
+        processes = []
+        if launch:
+            for i in range(self.workers):
+                process = multiprocessing.Process(target=run_worker, args=(address, self.host, directory))
+                process.start()
+                processes.append(process)
+        else:
+            print("Waiting for", self.workers, "workers: python pancake_distributed.py worker "
+                  + address[0] + ":" + str(address[1]), flush=True)
+
+        connections = []
+        for worker in range(self.workers):
+            sock, peer = server.accept()
+            reader = sock.makefile("rb")
+            connections.append((sock, reader, sock.makefile("wb"), read_json(reader)["address"]))
+        server.close()
+
+        peers = [worker_address for sock, reader, writer, worker_address in connections]
+        for worker, (sock, reader, writer, worker_address) in enumerate(connections):
+            send_json(writer, {
+                "worker": worker, "workers": self.workers, "stack_size": self.stack_size,
+                "burnt": self.burnt, "peers": peers,
+            })
+        for sock, reader, writer, worker_address in connections:
+            read_json(reader)
+
+        self.level_counts = [1]
+        unvisited = state_count(self.stack_size, self.burnt) - 1
+        level = 0
+        while unvisited:
+            for sock, reader, writer, worker_address in connections:
+                send_json(writer, {"level": level})
+            new = sum(read_json(reader)["new"] for sock, reader, writer, worker_address in connections)
+            if new == 0:
+                break
+            self.level_counts.append(new)
+            unvisited -= new
+            level += 1
+
+        for sock, reader, writer, worker_address in connections:
+            send_json(writer, {"finish": True})
+        self.paths = [read_json(reader)["written"] for sock, reader, writer, worker_address in connections]
+        for sock, reader, writer, worker_address in connections:
+            sock.close()
+        for process in processes:
+            process.join()
+        return self.level_counts
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="Build a distance table across several workers.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="coordinate a search")
+    run.add_argument("stack_size", type=int)
+    run.add_argument("--burnt", action="store_true")
+    run.add_argument("--workers", type=int, default=4)
+    run.add_argument("--host", default="127.0.0.1", help="address workers reach the coordinator on")
+    run.add_argument("--port", type=int, default=0)
+    run.add_argument("--external", action="store_true", help="wait for workers started elsewhere")
+    run.add_argument("--check", action="store_true", help="compare with a single-process build")
+    run.add_argument("--save", action="store_true", help="save the merged table to data/tables/")
+    worker = commands.add_parser("worker", help="join a search as a worker")
+    worker.add_argument("coordinator", help="host:port of the coordinator")
+    worker.add_argument("--host", default="127.0.0.1", help="address other workers reach this one on")
+    worker.add_argument("--directory", default=PART_DIR)
+    merge = commands.add_parser("merge", help="merge the shares of a finished search")
+    merge.add_argument("stack_size", type=int)
+    merge.add_argument("--burnt", action="store_true")
+    merge.add_argument("--workers", type=int, default=4)
+    merge.add_argument("--directory", default=PART_DIR)
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker(parse_address(args.coordinator), args.host, args.directory)
+        return
+    if args.command == "merge":
+        table = merge_parts(args.stack_size, args.burnt, args.workers, args.directory)
+        table.save()
+        print("saved", table.filename())
+        return
+
+    search = DistributedBFS(args.stack_size, args.burnt, args.workers, args.host, args.port)
+    start = time.perf_counter()
+    level_counts = search.run(launch=not args.external)
+    print("diameter", len(level_counts) - 1, "levels", level_counts,
+          "in", format(time.perf_counter() - start, ".1f"), "s")
+    if args.external:
+        # The shares are on the workers' machines; collect them and merge
+        print("shares written to", search.paths)
+        return
+    table = merge_parts(args.stack_size, args.burnt, args.workers)
+    if args.check:
+        single = TwoBitDistanceTable(
+            args.stack_size, args.burnt, adjacency=open_adjacency(args.stack_size, args.burnt)
+        )
+        single.build()
+        print("identical to a single-process build" if bytes(single.data) == bytes(table.data)
+              else "DIFFERENT from a single-process build")
+    if args.save:
+        table.save()
+        print("saved", table.filename())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+pancake_engine.py
+The rules of The Harried Waiter on plain lists, with no pygame, so that
+games can be simulated, load-tested and replayed headless.
+"""
+
+import random
+
+from pancake_stack import PancakeStack
+
+MIN_STACK = {False: 2, True: 1}   # Smallest stack for regular / burnt
+MAX_STACK = 12                    # Largest stack with a known diameter
+TREAP_STACK = 8192                # From here a PancakeStack flips faster than a list
+
+
+# --- Classes ---
+class GameEngine:
+    """ This class holds the state of one game: the start, current and
+        goal orders, the number of moves, and whether the player has
+        won. Game draws it on screen; anything else (tests, servers,
+        strategy evaluation) can drive it directly.
+        Stacks of TREAP_STACK pancakes or more are played on a
+        PancakeStack, so that each flip and win check is O(log n)
+        instead of O(n); current_order then behaves like a list but is
+        not one.
+    """
+
+    __slots__ = ("stack_size", "burnt", "goal_order", "start_order",
+                 "current_order", "moves", "game_over", "rng", "gaps")
+
+    def __init__(self, stack_size, burnt, start_order=None, rng=None):
+        self.rng = rng if rng is not None else random
+        self.new_game(stack_size, burnt, start_order)
+
+    def new_game(self, stack_size, burnt, start_order=None):
+        """ Start over with a fresh (or given) stack. Below MIN_STACK
+            every stack is already in order, so there is nothing to
+            deal.
+        """
+
+        if stack_size < MIN_STACK[burnt]:
+            raise ValueError("a stack needs at least " + str(MIN_STACK[burnt]) + " pancakes")
+
+        self.stack_size = stack_size
+        self.burnt = burnt
+        self.moves = 0
+        self.game_over = False
+
+        # This is how the order should be when we win
+        self.goal_order = list(range(1, self.stack_size+1))
+
+        # This is the starting order, random unless we were given one
+        if start_order is None:
+            start_order = self.deal()
+        self.start_order = list(start_order)
+
+        # This is the current order (will change with each move)
+        self.current_order = self.fresh_order()
+
+    def deal(self):
+        """ Return a random stack that is not already in order. """
+
+        start_order = self.goal_order.copy()
+        while start_order == self.goal_order:
+            # Get a random ordering of pancakes
+            order = self.goal_order.copy()
+            self.rng.shuffle(order)
+
+            # Get a random ordering of burntness
+            if self.burnt:
+                signs = self.rng.choices([-1,1], k=self.stack_size)
+            else:
+                signs = [1]*self.stack_size
+
+            # Use the two to create the random starting order
+            start_order = [i*j for i, j in zip(order, signs)]
+        return start_order
+
+    def fresh_order(self):
+        """ Return a copy of the start order to play on. For a treap we
+            also count the gaps (adjacent pairs, the plate included,
+            that are not neighbours in the goal); the stack is sorted
+            exactly when there are none.
+        """
+
+        if self.stack_size < TREAP_STACK:
+            return self.start_order.copy()
+        below = self.start_order[1:] + [self.stack_size + 1]
+        self.gaps = sum(self.is_gap(i, j) for i, j in zip(self.start_order, below))
+        return PancakeStack(self.start_order, self.burnt)
+
+    def is_gap(self, upper, lower):
+        if self.burnt:
+            return lower - upper != 1
+        return abs(lower - upper) != 1
+
+    def flip(self, n_to_flip):
+        """ Flip the top n_to_flip pancakes and record a move. Return
+            True if that won the game.
+        """
+
+        if n_to_flip <= 0 or self.game_over:
+            return False
+
+        if isinstance(self.current_order, PancakeStack):
+            # A flip keeps every pair inside the flipped part and below
+            # it neighbours or not, so only the pair across the cut can
+            # open or close a gap
+            order = self.current_order
+            n_to_flip = min(n_to_flip, self.stack_size)
+            below = order[n_to_flip] if n_to_flip < self.stack_size else self.stack_size + 1
+            self.gaps -= self.is_gap(order[n_to_flip-1], below)
+            order.flip(n_to_flip)
+            self.gaps += self.is_gap(order[n_to_flip-1], below)
+            self.moves += 1
+            self.game_over = self.gaps == 0
+            return self.game_over
+
+        top = self.current_order[n_to_flip-1::-1]
+        if self.burnt:
+            top = [-i for i in top]
+        self.current_order[:n_to_flip] = top
+        self.moves += 1
+
+        # Did we win?
+        if self.current_order == self.goal_order:
+            self.game_over = True
+        return self.game_over
+
+    def reset(self):
+        """ Return the stack to its original order with zero moves. """
+
+        self.moves = 0
+        self.current_order = self.fresh_order()
+
+    def restart(self):
+        """ Deal a fresh stack of the same size and variant. """
+
+        self.new_game(self.stack_size, self.burnt)
+
+    def toggle_burntness(self):
+        """ Switch between regular and burnt pancakes. We always want
+            2+ since min size of unburned stack is 2.
+        """
+
+        self.new_game(max(self.stack_size, MIN_STACK[False]), not self.burnt)
+
+    def add_pancake(self):
+        """ Deal a fresh stack with one more pancake, up to MAX_STACK. """
+
+        self.new_game(min(self.stack_size + 1, MAX_STACK), self.burnt)
+
+    def remove_pancake(self):
+        """ Deal a fresh stack with one fewer pancake. """
+
+        self.new_game(max(self.stack_size - 1, MIN_STACK[self.burnt]), self.burnt)
+
+    def replay(self, flips):
+        """ Apply a recorded sequence of flips from the current order.
+            Return the number of flips applied before the game was won.
+            On a large stack each flip is O(log n) (see TREAP_STACK).
+        """
+
+        applied = 0
+        for n_to_flip in flips:
+            if self.game_over:
+                break
+            self.flip(n_to_flip)
+            applied += 1
+        return applied
+
+    def play(self, strategy, max_moves=1000):
+        """ Let a strategy play until it wins or runs out of moves.
+            strategy(current_order, burnt) returns how many pancakes to
+            flip. Return the number of moves made.
+        """
+
+        for i in range(max_moves):
+            if self.game_over:
+                break
+            self.flip(strategy(self.current_order, self.burnt))
+        return self.moves
@@ -5,8 +5,23 @@ Developed on Python 3.7.6
 Nathaniel Schmucker
 """
 
+import os
+from collections import deque
+
 import pygame
-import random
+
+from pancake_adjacency import neighbor_ranks, open_adjacency
+from pancake_beam import AnytimeBeamSearch
+from pancake_diameters import diameter_table
+from pancake_dispatch import DISPATCH_LOG, SolverDispatcher
+from pancake_engine import GameEngine
+from pancake_frames import FrameTimer, ProfileCapture
+from pancake_histograms import harder_than
+from pancake_oracle import make_oracle
+from pancake_paths import OptimalPaths
+from pancake_ranking import rank, unrank
+from pancake_stack import PancakeStack
+from pancake_store import open_store
 
 # --- Global constants ---
 BLACK    = (  0,   0,   0)
@@ -17,22 +32,10 @@ DK_BROWN = (180,  83,  38)
 SCREEN_WIDTH  = 750
 SCREEN_HEIGHT = 550
 
-# Regular: https://oeis.org/A058986
-# Burned:  https://oeis.org/A078941
-DIAMETER = {
-    1: {"regular": 0, "burned": 1},
-    2: {"regular": 1, "burned": 4},
-    3: {"regular": 3, "burned": 6},
-    4: {"regular": 4, "burned": 8},
-    5: {"regular": 5, "burned": 10},
-    6: {"regular": 7, "burned": 12},
-    7: {"regular": 8, "burned": 14},
-    8: {"regular": 9, "burned": 15},
-    9: {"regular": 10, "burned": 17},
-    10: {"regular": 11, "burned": 18},
-    11: {"regular": 13, "burned": 19},
-    12: {"regular": 14, "burned": 21}
-}
+BEAM_BUDGET = 0.004     # Seconds per frame to spend improving best known
+STATUS_TIME = 4000      # Milliseconds a diagnostic status line stays up
+
+DIAMETER = diameter_table()     # Upper bounds, exact for every size the game deals
 
 INFO_TEXT = [
     """
@@ -125,6 +128,8 @@ class Graph:
         have been discovered, and reporting the length of the shortest
         path from A to B, as well as the vertices on the path.
         The class accepts burnt pancakes. Edges are unweighted.
+        When there is an adjacency table for the stack size, BFS runs
+        over ranks and reads neighbours from it instead of flipping.
     """
 
     def __init__(self, start, goal, burnt):
@@ -134,10 +139,19 @@ class Graph:
         self.visited = {}
         self.fewest_moves = None
         self.best_path = []
+        self.adjacency = open_adjacency(len(start), burnt)
 
     def flip(self, vertex_name, n_to_flip):
         """ Given a vertex and an index, perform prefix reversal. """
-        
+
+        # Graph keeps every vertex, so a PancakeStack is copied before
+        # it is flipped. The copy is O(n), like the list below; only
+        # flips of a single stack in place are O(log n).
+        if isinstance(vertex_name, PancakeStack):
+            new_vertex_name = PancakeStack(vertex_name.to_list(), self.burnt)
+            new_vertex_name.flip(n_to_flip + 1)
+            return new_vertex_name
+
         new_vertex_name = []
         if self.burnt:
             b = -1
@@ -192,6 +206,10 @@ class Graph:
             which modifies the typical Breadth First Search algorithm
             to find the shortest path between two vertices on a graph.
         """
+        if self.adjacency is not None:
+            self.BFS_ranks()
+            return
+
         # Clear the list of visited vertices
         self.visited = {}
 
@@ -234,6 +252,44 @@ class Graph:
                         }
                         queue.append(i)
     
+    def BFS_ranks(self):
+        """ The same search over ranks, with the neighbours of each
+            rank read from the adjacency table. Nothing is flipped or
+            turned into a vertex_key until the goal is found; then only
+            the vertices on the path are entered in visited, which is
+            all traceback needs.
+        """
+
+        n = len(self.start)
+        start = rank(self.start, self.burnt)
+        goal = rank(self.goal, self.burnt)
+        prev = {start: None}
+        queue = deque([start])
+        while queue:
+            index = queue.popleft()
+            if index == goal:
+                break
+            for n_to_flip, neighbor in neighbor_ranks(index, n, self.burnt, self.adjacency):
+                if neighbor not in prev:
+                    prev[neighbor] = index
+                    queue.append(neighbor)
+
+        path = []
+        index = goal
+        while index is not None:
+            path.insert(0, index)
+            index = prev[index]
+
+        self.visited = {}
+        previous = None
+        for dist, index in enumerate(path):
+            name = unrank(index, n, self.burnt)
+            vertex_key = self.make_vertex_key(name)
+            self.visited[vertex_key] = {"name": name, "dist": dist, "prev": previous}
+            previous = vertex_key
+        self.fewest_moves = len(path) - 1
+        self.best_path = self.traceback()
+
     def traceback(self):
         """ Generate a list of vertex_keys on the shortest path from
             start to goal.
@@ -346,52 +402,32 @@ class Button:
 
 
 class Game(object):
-    """ This class represents an instance of the game. If we need to
-        restart the game, we create a new instance of this class.
+    """ This class represents an instance of the game on screen. The
+        rules and the state of the stack live in a GameEngine; this
+        class draws it and turns clicks into moves. When the engine
+        deals a new stack, new_stack sets up for it and keeps the rest.
     """
  
-    def __init__(self, stack_size, burnt, font):
+    def __init__(self, stack_size, burnt, font, engine=None):
         """ Create all our attributes to initialize the game. """
 
         self.pos = [-1,-1]
         self.show_info = False
         self.info_item = -1
-        self.moves = 0
-        self.stack_size = stack_size
-        self.burnt = burnt
         self.font = font
-        self.game_over = False
 
-        # Create lists to track order of stack
-        # This is how the order should be when we win
-        self.goal_order = list(range(1, self.stack_size+1))
-        
-        # This is the random starting order
-        # Ensure we aren't starting with a winning arrangement
-        self.start_order = self.goal_order.copy()
-        while self.start_order == self.goal_order:
-            # Get a random ordering of pancakes
-            order = self.goal_order.copy()
-            random.shuffle(order)
-            
-            # Get a random ordering of burntness
-            if self.burnt:
-                signs = random.choices([-1,1], k=self.stack_size)
-            else:
-                signs = [1]*self.stack_size
-            
-            # Use the two to create the random starting order
-            self.start_order = []
-            for i, j in zip(order, signs):
-                self.start_order.append(i*j)
-
-        # This is the current order (will change with each move)
-        self.current_order = self.start_order.copy()
+        # Diagnostics: F3 shows frame times, F8 saves them to CSV and F9
+        # starts or stops a profiler capture
+        self.frame_timer = FrameTimer()
+        self.profile = ProfileCapture()
+        self.show_timings = False
+        self.status = None          # (text, tick it goes away at)
 
-        # Generate the pancake_graph and run BFS if it won't take long
-        self.pancake_graph = Graph(self.start_order, self.goal_order, self.burnt)
-        if self.BFS_eligible():
-            self.pancake_graph.BFS()
+        # Deal a random starting order, unless we were given an engine
+        # that already has one
+        if engine is None:
+            engine = GameEngine(stack_size, burnt)
+        self.engine = engine
 
         # Buttons for controling gameplay
         button_dict = {
@@ -457,13 +493,87 @@ class Game(object):
         # Generate all Buttons and Pancakes; add to appropriate lists
         self.make_buttons(button_dict=button_dict)
         self.make_info_buttons(button_dict=info_button_dict)
+
+        # Chooses how to solve each new stack, logging each choice for
+        # calibrate; kept between stacks so it measures this machine
+        # only once
+        self.dispatcher = SolverDispatcher(graph_class=Graph, log_path=DISPATCH_LOG)
+        self.new_stack()
+
+    def new_stack(self):
+        """ Set up for the stack the engine has just dealt: solve it,
+            and replace the Pancakes. Buttons and other chrome are kept,
+            and so are the distance tables, which serve every stack of
+            the same size and variant.
+        """
+
+        # Keeps the optimal number of moves left up to date after every
+        # flip, when there is a distance table for this size. Its table
+        # also gives the fewest moves from the start in one walk.
+        self.oracle = make_oracle(self.start_order, self.goal_order, self.burnt)
+
+        # How forgiving the stack is: the number of optimal solutions,
+        # counted over the table without listing them
+        self.optimal_solutions = None
+        if self.oracle is not None:
+            self.optimal_solutions = OptimalPaths(
+                self.start_order, self.goal_order, self.burnt, self.oracle.table
+            ).count
+
+        # The dispatcher picks whichever solver it expects to answer
+        # fastest (a table, the store of solved stacks, BFS, IDA* or the
+        # local solver service), if any can answer within its budget
+        self.pancake_graph = Graph(self.start_order, self.goal_order, self.burnt)
+        self.dispatch = self.dispatcher.solve(self.start_order, self.goal_order, self.burnt)
+        self.pancake_graph.fewest_moves = self.dispatch.fewest_moves
+
+        # With no exact answer, show the best solution found so far and
+        # keep improving it a few milliseconds per frame
+        self.beam = None
+        if self.pancake_graph.fewest_moves is None:
+            self.beam = AnytimeBeamSearch(self.start_order, self.goal_order, self.burnt)
+
+        # How this stack compares to every other stack of its size
+        self.harder_than = None
+        if self.pancake_graph.fewest_moves is not None:
+            self.harder_than = harder_than(
+                self.pancake_graph.fewest_moves, self.stack_size, self.burnt
+            )
+
+        # Swallow the click that brought us here, so that it does not
+        # also land on the new stack
+        self.pos = [-1,-1]
+        self.pancake_list.empty()
         self.make_pancake_stack()
 
-    def BFS_eligible(self):
-        """ Return True if it won't take too long to run the BFS. """
-        
-        return (not self.burnt and self.stack_size < 8
-            or self.burnt and self.stack_size < 6)
+    # --- Game state, read from the engine ---
+    @property
+    def stack_size(self):
+        return self.engine.stack_size
+
+    @property
+    def burnt(self):
+        return self.engine.burnt
+
+    @property
+    def moves(self):
+        return self.engine.moves
+
+    @property
+    def game_over(self):
+        return self.engine.game_over
+
+    @property
+    def goal_order(self):
+        return self.engine.goal_order
+
+    @property
+    def start_order(self):
+        return self.engine.start_order
+
+    @property
+    def current_order(self):
+        return self.engine.current_order
 
     def make_buttons(self, button_dict):
         """ For each item in dictionary, make a Button (gameplay). """
@@ -498,15 +608,51 @@ class Game(object):
             )
             self.pancake_list.add(pancake)  
 
+        self.make_stack_layer()
+
+    def make_stack_layer(self):
+        """ Compose every Pancake into one surface, so that drawing the
+            stack is a single blit. Black is transparent, like the
+            screen behind it.
+        """
+
+        width = 100 + 30 * self.stack_size
+        self.stack_layer = pygame.Surface([width, 30 * self.stack_size]).convert()
+        self.stack_layer_pos = [
+            (SCREEN_WIDTH // 2) - (width // 2),
+            (SCREEN_HEIGHT - 50) - (30 * self.stack_size)
+        ]
+        self.compose_stack(self.stack_size)
+
+    def compose_stack(self, n_to_flip):
+        """ Redraw the top n_to_flip slots of the stack layer; the
+            Pancakes below a flip have not moved.
+        """
+
+        # Slot i is the 30 pixel band starting 30 * i from the top
+        self.stack_layer.fill(BLACK, [0, 0, self.stack_layer.get_width(), 30 * n_to_flip])
+        x, y = self.stack_layer_pos
+        for pancake in self.pancake_list:
+            if pancake.loc < n_to_flip:
+                self.stack_layer.blit(pancake.image, [pancake.rect.x - x, pancake.rect.y - y])
+
+        # Draw from a run-length encoded copy: blitting it skips the
+        # transparent runs, so it costs about what the Pancakes cover.
+        # The layer itself stays plain, since every change to an
+        # encoded surface encodes it again.
+        self.stack_image = self.stack_layer.copy()
+        self.stack_image.set_colorkey(BLACK, pygame.RLEACCEL)
+
     def reset_stack(self):
         """ When reset button is clicked, set moves to zero and
             create a fresh stack of Pancakes using start_order.
         """
         
-        self.moves = 0
+        self.engine.reset()
+        if self.oracle is not None:
+            self.oracle.reset(self.start_order)
         self.pancake_list.empty()
-        self.current_order = self.start_order.copy()
-        self.make_pancake_stack() 
+        self.make_pancake_stack()
 
     def toggle_burntness(self):
         """ When burntness button is clicked, toggle between burned 
@@ -514,9 +660,9 @@ class Game(object):
             fresh stack.
         """
 
-        # Generate new instance of w/ opposite burntness
-        # We always want 2+ since min size of unburned stack is 2
-        self.__init__(max(self.stack_size, 2), not self.burnt, self.font)
+        # Deal a stack with the opposite burntness
+        self.engine.toggle_burntness()
+        self.new_stack()
 
     def add_pancake(self):
         """ When button is clicked, generate a fresh stack with 
@@ -526,19 +672,17 @@ class Game(object):
         # Diamater of pancake graph known for burnt flipping up to n=12
         # Higher for unburned, but we will limit to 12, as that's a lot
         # For reference, see https://oeis.org/A078941
-        self.__init__(min(self.stack_size + 1, 12), self.burnt, self.font)
+        self.engine.add_pancake()
+        self.new_stack()
 
     def remove_pancake(self):
         """ When button is clicked, generate a fresh stack with 
             n-1 Pancakes.
         """
 
-        # Generate a new instance of the game
         # Unburned needs at least 2 Pancakes
-        if self.burnt:
-            self.__init__(max(self.stack_size-1, 1), self.burnt, self.font)
-        else:
-            self.__init__(max(self.stack_size-1, 2), self.burnt, self.font)
+        self.engine.remove_pancake()
+        self.new_stack()
 
     def display_info(self):
         """ Open the info screen, starting at the first screen. """
@@ -582,19 +726,53 @@ class Game(object):
             if event.type == pygame.QUIT:
                 return True
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                # Get the current mouse position
-                self.pos = pygame.mouse.get_pos()
+                # Get the position of the click
+                self.pos = event.pos
 
                 # After winning, restart on click
                 if self.game_over:
-                    self.__init__(self.stack_size, self.burnt, self.font)
+                    self.engine.restart()
+                    self.new_stack()
+            if event.type == pygame.KEYDOWN:
+                self.process_key(event.key)
  
         return False
 
+    def process_key(self, key):
+        """ Handle the diagnostic hotkeys. """
+
+        if key == pygame.K_F3:
+            self.show_timings = not self.show_timings
+        elif key == pygame.K_F8:
+            path = self.frame_timer.write_csv()
+            self.show_status("Frame times saved as "+os.path.basename(path))
+        elif key == pygame.K_F9:
+            path = self.profile.toggle()
+            if path is None:
+                self.show_status("Profiling started")
+            else:
+                self.show_status("Profile saved as "+os.path.basename(path))
+
+    def show_status(self, text):
+        """ Show a line of diagnostic feedback for STATUS_TIME. """
+
+        self.status = (text, pygame.time.get_ticks() + STATUS_TIME)
+
     def run_logic(self):
         """ This method is run each time through the frame. It checks 
             for Pancake selections and flips them.
         """
+
+        # Spend what is left of the frame tightening the best known
+        # solution; once it is proven optimal it becomes fewest_moves
+        if self.beam is not None and not self.beam.proven:
+            self.beam.improve(BEAM_BUDGET)
+            if self.beam.proven:
+                open_store().put(self.beam.order, self.burnt, self.beam.best_flips)
+                self.pancake_graph.fewest_moves = self.beam.best_moves
+                self.harder_than = harder_than(
+                    self.beam.best_moves, self.stack_size, self.burnt
+                )
             
         if not self.show_info:
             # Check for collisions with a Button and do an action
@@ -607,20 +785,17 @@ class Game(object):
             for pancake in self.pancake_list:
                 if pancake.rect.collidepoint(self.pos):
                     pancakes_to_flip = pancake.loc + 1
-                    
-                    # Record a move
-                    self.moves += 1
-                    
-            # Update Pancakes
-            self.pancake_list.update(pancakes_to_flip) 
-            
-            # Refresh the current order tracking list
-            for pancake in self.pancake_list:
-                self.current_order[pancake.loc] = pancake.n
 
-            # Did we win?
-            if self.current_order == self.goal_order:
-                self.game_over = True
+            # Record a move (the engine also checks whether we won)
+            # and update Pancakes to match
+            self.engine.flip(pancakes_to_flip)
+            self.pancake_list.update(pancakes_to_flip)
+            if pancakes_to_flip:
+                self.compose_stack(pancakes_to_flip)
+                # A new stack gets a fresh oracle, so only flips need
+                # to move it
+                if self.oracle is not None:
+                    self.oracle.update(self.current_order)
         
         else:
             # Check for collisions with an info Button and do an action
@@ -646,22 +821,26 @@ class Game(object):
                 center_y = (SCREEN_HEIGHT - 30) - (text.get_height() // 2)
                 screen.blit(text, [center_x, center_y])
         
-            if self.BFS_eligible():
+            if self.harder_than is not None:
                 text = font.render(
-                    "(Fewest possible moves: "+str(self.pancake_graph.fewest_moves)+")",
+                    "(Fewest possible moves: "+str(self.pancake_graph.fewest_moves)
+                    +", harder than "+str(round(self.harder_than))+"%)",
                     True, WHITE
                 )
                 screen.blit(text, [175, 10])
-            elif self.burnt:
+            elif self.pancake_graph.fewest_moves is not None:
                 text = font.render(
-                    "(Possible in "+str(DIAMETER[self.stack_size]["burned"])+" moves or fewer)",
+                    "(Fewest possible moves: "+str(self.pancake_graph.fewest_moves)+")",
                     True, WHITE
                 )
                 screen.blit(text, [175, 10])
             else:
+                variant = "burned" if self.burnt else "regular"
                 text = font.render(
-                    "(Possible in "+str(DIAMETER[self.stack_size]["regular"])+" moves or fewer)",
-                    True, WHITE)
+                    "(Best known: "+str(self.beam.best_moves)+" moves, none need more than "
+                    +str(DIAMETER[self.stack_size][variant])+")",
+                    True, WHITE
+                )
                 screen.blit(text, [175, 10])
 
             text = font.render("Current moves: "+str(self.moves), True, WHITE)
@@ -676,7 +855,16 @@ class Game(object):
             text = font.render("Goal order: "+str(self.goal_order), True, WHITE)
             screen.blit(text, [10, 85])
 
-            self.pancake_list.draw(screen)
+            if self.oracle is not None:
+                text = font.render(
+                    "Optimal remaining: "+str(self.oracle.remaining)
+                    +"   Wasted moves: "+str(self.oracle.wasted_moves(self.moves))
+                    +"   Optimal solutions: "+str(self.optimal_solutions),
+                    True, WHITE
+                )
+                screen.blit(text, [10, 110])
+
+            screen.blit(self.stack_image, self.stack_layer_pos)
 
         else:
             for info_button in self.info_button_list:
@@ -684,8 +872,34 @@ class Game(object):
             
             self.draw_long_text(screen, font, INFO_TEXT[self.info_item], [10, 10])
 
+        if self.status is not None and pygame.time.get_ticks() >= self.status[1]:
+            self.status = None
+        if self.status is not None:
+            text = font.render(self.status[0], True, WHITE)
+            screen.blit(text, [10, 135])
+
+        if self.show_timings:
+            self.draw_timings(screen, font)
+
         pygame.display.flip()
 
+    def draw_timings(self, screen, font):
+        """ Overlay the median and 99th percentile time of each phase
+            of the recent frames.
+        """
+
+        lines = [
+            phase+": p50 "+"%.1f" % p50+" ms, p99 "+"%.1f" % p99+" ms"
+            for phase, (p50, p99) in self.frame_timer.summary().items()
+        ]
+        if self.profile.active:
+            lines.append("Profiling (F9 to stop)")
+        # Start below the status line, if one is up
+        top = 135 if self.status is None else 160
+        for i, line in enumerate(lines):
+            text = font.render(line, True, WHITE)
+            screen.blit(text, [10, top + 25 * i])
+
 
 # --- Main function ---
 def main():
@@ -709,17 +923,19 @@ def main():
     # Loop until player exits window
     done = False
 
-    # Main game loop
+    # Main game loop, timing each phase of every frame
+    timer = game.frame_timer
     while not done:
  
         # Process events (keystrokes, mouse clicks, etc)
-        done = game.process_events()
+        done = timer.time("process_events", game.process_events)
  
         # Update object positions
-        game.run_logic()
+        timer.time("run_logic", game.run_logic)
  
         # Draw the current frame
-        game.display_frame(screen, font)
+        timer.time("display_frame", game.display_frame, screen, font)
+        timer.end_frame()
  
         # Limit to 60 frames per second
         clock.tick(60)
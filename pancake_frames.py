@@ -0,0 +1,127 @@
+"""
+pancake_frames.py
+Where the game's frames go: per-phase frame times kept in a ring buffer,
+and a cProfile capture that can be switched on and off while the game
+runs.
+"""
+
+import cProfile
+import csv
+import os
+import time
+from array import array
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "profiles")
+PHASES = ("process_events", "run_logic", "display_frame")
+
+
+# --- Classes ---
+class FrameTimer:
+    """ This class times each phase of the game loop and keeps the last
+        size frames, overwriting the oldest, so it costs the same after
+        an hour of play as after a minute.
+    """
+
+    def __init__(self, size=600, phases=PHASES):
+        self.size = size
+        self.phases = phases
+        self.samples = {phase: array("d", bytes(8 * size)) for phase in phases}
+        self.frames = 0         # Frames recorded since the start
+
+    def time(self, phase, function, *args):
+        """ Call function(*args), record how long it took as this
+            frame's phase, and return its result.
+        """
+
+        start = time.perf_counter()
+        result = function(*args)
+        self.samples[phase][self.frames % self.size] = time.perf_counter() - start
+        return result
+
+    def end_frame(self):
+        self.frames += 1
+
+    def recent(self, phase):
+        """ Return the kept times of a phase, oldest first, in seconds.
+            The slot of the frame in progress is left out, since it may
+            already hold part of that frame.
+        """
+
+        samples = self.samples[phase]
+        if self.frames < self.size:
+            return list(samples[:self.frames])
+        split = self.frames % self.size
+        return list(samples[split+1:]) + list(samples[:split])
+
+    def percentile(self, phase, q):
+        """ The q-th percentile (0 to 100) of a phase's kept times, by
+            nearest rank. None before the first frame.
+        """
+
+        times = sorted(self.recent(phase))
+        if not times:
+            return None
+        rank = max(1, -(-q * len(times) // 100))
+        return times[int(rank) - 1]
+
+    def summary(self):
+        """ Return {phase: (p50, p99)} in milliseconds. """
+
+        summary = {}
+        for phase in self.phases:
+            if self.frames:
+                summary[phase] = (
+                    1000 * self.percentile(phase, 50), 1000 * self.percentile(phase, 99)
+                )
+        return summary
+
+    def write_csv(self, path=None):
+        """ Write the kept frames, one row each in milliseconds, and
+            return the path.
+        """
+
+        if path is None:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, time.strftime("frames-%Y%m%d-%H%M%S.csv"))
+        columns = [self.recent(phase) for phase in self.phases]
+        first = self.frames - len(columns[0])
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame"] + [phase + "_ms" for phase in self.phases] + ["total_ms"])
+            for i, times in enumerate(zip(*columns)):
+                writer.writerow(
+                    [first + i] + ["%.3f" % (1000 * t) for t in times]
+                    + ["%.3f" % (1000 * sum(times))]
+                )
+        return path
+
+
+class ProfileCapture:
+    """ This class starts and stops a cProfile capture of the running
+        game, writing each capture to its own pstats file.
+    """
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self.profile = None
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def toggle(self):
+        """ Start a capture, or stop the running one and return the path
+            of its pstats file (None when starting).
+        """
+
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            return None
+
+        self.profile.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime("game-%Y%m%d-%H%M%S.pstats"))
+        self.profile.dump_stats(path)
+        self.profile = None
+        return path
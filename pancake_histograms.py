@@ -0,0 +1,101 @@
+"""
+pancake_histograms.py
+How many stacks of each size sit at each distance from the sorted
+stack, so that the game can say how hard a dealt stack is.
+"""
+
+import json
+import os
+
+from pancake_adjacency import open_adjacency
+from pancake_layers import LayerSweep
+
+HISTOGRAM_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "distance_histograms.json"
+)
+
+# Histograms loaded from (or added to) HISTOGRAM_FILE, keyed like
+# DIAMETER: {"regular": {n: [count at distance 0, 1, ...]}, "burned": ...}
+_histograms = None
+
+
+# --- Functions ---
+def count_bits(bitset):
+    """ Count the set bits of a whole bitset at once. """
+
+    return bin(int.from_bytes(bitset, "little")).count("1")
+
+
+def compute_histogram(stack_size, burnt):
+    """ Sweep the whole graph level by level and count each level. With
+        numpy installed each level is expanded in batches (see
+        pancake_batch.level_counts); otherwise LayerSweep expands it a
+        rank at a time and each level is counted with one popcount over
+        its bitset.
+    """
+
+    adjacency = open_adjacency(stack_size, burnt)
+    try:
+        from pancake_batch import level_counts
+    except ImportError:
+        sweep = LayerSweep(stack_size, burnt, adjacency)
+        return [count_bits(bitset) for distance, bitset in sweep.levels()]
+    return level_counts(stack_size, burnt, adjacency)
+
+
+def load_histograms(path=HISTOGRAM_FILE):
+    global _histograms
+    if _histograms is None:
+        _histograms = {"regular": {}, "burned": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                for variant, by_size in json.load(f).items():
+                    for stack_size, counts in by_size.items():
+                        _histograms[variant][int(stack_size)] = counts
+    return _histograms
+
+
+def save_histograms(path=HISTOGRAM_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(load_histograms(path), f, indent=1, sort_keys=True)
+
+
+def histogram(stack_size, burnt, compute=True):
+    """ Return [number of stacks at distance 0, 1, ...]. Histograms are
+        read from the data file; a missing one is computed and saved
+        if compute is True, otherwise None is returned.
+    """
+
+    variant = "burned" if burnt else "regular"
+    histograms = load_histograms()
+    if stack_size not in histograms[variant]:
+        if not compute:
+            return None
+        histograms[variant][stack_size] = compute_histogram(stack_size, burnt)
+        save_histograms()
+    return histograms[variant][stack_size]
+
+
+def harder_than(distance, stack_size, burnt):
+    """ Return the percentage of stacks that need fewer flips than
+        distance, or None if there is no histogram for this size.
+    """
+
+    counts = histogram(stack_size, burnt, compute=False)
+    if counts is None:
+        return None
+    return 100 * sum(counts[:distance]) / sum(counts)
+
+
+# --- Main function ---
+def main():
+    """ Fill in the data file for every stack the sweep can handle. """
+
+    for burnt, largest in ((False, 9), (True, 7)):
+        for stack_size in range(1 if burnt else 2, largest + 1):
+            counts = histogram(stack_size, burnt)
+            print("burned" if burnt else "regular", stack_size, counts)
+
+if __name__ == "__main__":
+    main()
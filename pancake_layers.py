@@ -0,0 +1,184 @@
+"""
+pancake_layers.py
+Stream every stack at a given distance from the sorted stack (by
+default the antipodes, the stacks that need DIAMETER[n] flips) in rank
+order, without holding the graph in memory.
+"""
+
+import os
+import random
+import struct
+
+from pancake_adjacency import neighbor_ranks, open_adjacency
+from pancake_ranking import state_count, unrank
+
+LAYER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "layers")
+LAYER_MAGIC = b"PLY1"
+LAYER_HEADER = struct.Struct("<4sBBBBQ")   # magic, n, burnt, distance, rank bytes, count
+
+
+# --- Classes ---
+class LayerSweep:
+    """ This class runs a Breadth First Search from the sorted stack
+        over ranks, keeping only three bitsets (visited, current level,
+        next level): 3 bits per stack instead of a Graph.visited entry.
+        Each level is available in rank order as soon as it is done.
+    """
+
+    def __init__(self, stack_size, burnt, adjacency=None):
+        self.stack_size = stack_size
+        self.burnt = burnt
+        self.size = state_count(stack_size, burnt)
+        self.adjacency = adjacency  # Optional AdjacencyTable for neighbours
+
+    def new_bitset(self):
+        return bytearray((self.size + 7) // 8)
+
+    def levels(self):
+        """ Yield (distance, bitset) for each level of the search. Only
+            the visited set and the last two levels are kept, so copy a
+            bitset if it is needed after the following level is asked
+            for.
+        """
+
+        visited = self.new_bitset()
+        current = self.new_bitset()
+        visited[0] |= 1
+        current[0] |= 1
+        distance = 0
+
+        while True:
+            yield distance, current
+
+            following = self.new_bitset()
+            found = False
+            for index in iter_bits(current):
+                for n_to_flip, neighbor in neighbor_ranks(
+                    index, self.stack_size, self.burnt, self.adjacency
+                ):
+                    byte, bit = neighbor >> 3, 1 << (neighbor & 7)
+                    if not visited[byte] & bit:
+                        visited[byte] |= bit
+                        following[byte] |= bit
+                        found = True
+            if not found:
+                return
+            current = following
+            distance += 1
+
+
+# --- Functions ---
+def iter_bits(bitset):
+    """ Yield the index of every set bit, in increasing order. """
+
+    for byte_index, byte in enumerate(bitset):
+        if byte:
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield (byte_index << 3) | bit
+
+
+def iter_layer_ranks(stack_size, burnt, distance=None):
+    """ Yield (rank, distance) for every stack at the given distance,
+        in rank order. With no distance, yield the last layer (the
+        antipodes).
+    """
+
+    last = None
+    sweep = LayerSweep(stack_size, burnt, open_adjacency(stack_size, burnt))
+    for depth, bitset in sweep.levels():
+        if depth == distance:
+            for index in iter_bits(bitset):
+                yield index, depth
+            return
+        if distance is None:
+            last = (depth, bytes(bitset))
+
+    # We only know which layer was the last once the search runs out
+    if last is not None:
+        for index in iter_bits(last[1]):
+            yield index, last[0]
+
+
+def iter_layer(stack_size, burnt, distance=None):
+    """ Yield (order, distance) for every stack at the given distance
+        (by default, every stack that needs the most flips), in rank
+        order.
+    """
+
+    for index, depth in iter_layer_ranks(stack_size, burnt, distance):
+        yield unrank(index, stack_size, burnt), depth
+
+
+def write_layer(path, stack_size, burnt, distance=None):
+    """ Stream a layer to a compact binary file: a fixed header, then
+        each rank as a little-endian integer of the smallest whole
+        number of bytes. Return the number of stacks written.
+    """
+
+    rank_bytes = max(1, ((state_count(stack_size, burnt) - 1).bit_length() + 7) // 8)
+    count = 0
+    depth = distance if distance is not None else 0
+    with open(path, "wb") as f:
+        f.write(LAYER_HEADER.pack(LAYER_MAGIC, stack_size, int(burnt), depth, rank_bytes, 0))
+        for index, depth in iter_layer_ranks(stack_size, burnt, distance):
+            f.write(index.to_bytes(rank_bytes, "little"))
+            count += 1
+
+        # Go back and fill in what we only know at the end
+        f.seek(0)
+        f.write(LAYER_HEADER.pack(LAYER_MAGIC, stack_size, int(burnt), depth, rank_bytes, count))
+    return count
+
+
+def read_layer_header(f):
+    magic, stack_size, burnt, distance, rank_bytes, count = LAYER_HEADER.unpack(
+        f.read(LAYER_HEADER.size)
+    )
+    if magic != LAYER_MAGIC:
+        raise ValueError("not a pancake layer file")
+    return stack_size, bool(burnt), distance, rank_bytes, count
+
+
+def read_layer(path):
+    """ Yield (order, distance) for every stack in a layer file. """
+
+    with open(path, "rb") as f:
+        stack_size, burnt, distance, rank_bytes, count = read_layer_header(f)
+        for i in range(count):
+            index = int.from_bytes(f.read(rank_bytes), "little")
+            yield unrank(index, stack_size, burnt), distance
+
+
+def sample_layer(path, k=1):
+    """ Return k stacks drawn at random from a layer file, reading only
+        the records that were picked.
+    """
+
+    with open(path, "rb") as f:
+        stack_size, burnt, distance, rank_bytes, count = read_layer_header(f)
+        samples = []
+        for i in random.sample(range(count), min(k, count)):
+            f.seek(LAYER_HEADER.size + i * rank_bytes)
+            index = int.from_bytes(f.read(rank_bytes), "little")
+            samples.append(unrank(index, stack_size, burnt))
+    return samples
+
+
+def layer_path(stack_size, burnt, directory=LAYER_DIR):
+    variant = "burned" if burnt else "regular"
+    return os.path.join(directory, variant + "-n" + str(stack_size) + ".layer")
+
+
+# --- Main function ---
+def main():
+    """ Write the antipodes of every small stack to data/layers/. """
+
+    os.makedirs(LAYER_DIR, exist_ok=True)
+    for burnt, largest in ((False, 9), (True, 6)):
+        for stack_size in range(2, largest + 1):
+            count = write_layer(layer_path(stack_size, burnt), stack_size, burnt)
+            print(layer_path(stack_size, burnt), count, "stacks")
+
+if __name__ == "__main__":
+    main()
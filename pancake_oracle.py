@@ -0,0 +1,93 @@
+"""
+pancake_oracle.py
+Track the optimal number of moves left to the goal as the player flips,
+without searching again after every move.
+"""
+
+from pancake_adjacency import open_adjacency
+from pancake_ranking import rank
+from pancake_relabel import normalise
+from pancake_tables import TwoBitDistanceTable, open_table
+
+# Largest stacks (exclusive) whose table is quick enough to build in
+# memory when there is no saved one
+BUILD_LIMIT = {False: 8, True: 6}
+
+# Tables built in this process, keyed by (stack_size, burnt)
+_built_tables = {}
+
+
+# --- Functions ---
+def goal_table(stack_size, burnt, build=True):
+    """ Return a distance table rooted at the sorted stack: the saved
+        one, or one built in memory for small stacks (if build is
+        False, only one built already). None if neither.
+    """
+
+    table = open_table(stack_size, burnt)
+    if table is not None:
+        return table
+    key = (stack_size, burnt)
+    if stack_size >= BUILD_LIMIT[burnt] or not build and key not in _built_tables:
+        return None
+    if key not in _built_tables:
+        table = TwoBitDistanceTable(
+            stack_size, burnt, adjacency=open_adjacency(stack_size, burnt)
+        )
+        table.build()
+        _built_tables[key] = table
+    return _built_tables[key]
+
+
+# --- Classes ---
+class DistanceOracle:
+    """ This class knows the optimal number of moves from the current
+        stack to the goal at every point of a game.
+        The exact distance of the start is walked out once. After that,
+        a flip can only change the distance by -1, 0 or +1, and the
+        table's distance mod 3 of the new stack tells which, so each
+        update is a single rank and table lookup.
+    """
+
+    def __init__(self, start, goal, burnt, table):
+        self.goal = goal
+        self.burnt = burnt
+        self.table = table
+        self.start_distance = table.distance(normalise(start, goal))
+        self.reset(start)
+
+    def reset(self, order):
+        """ Go back to the start, where the distance is already known. """
+
+        self.rank = rank(normalise(order, self.goal), self.burnt)
+        self.residue = self.table.get(self.rank)
+        self.remaining = self.start_distance
+
+    def update(self, order):
+        """ Move to order, which must be the current stack or one flip
+            away from it. Return the new optimal distance to the goal.
+        """
+
+        new_rank = rank(normalise(order, self.goal), self.burnt)
+        if new_rank != self.rank:
+            new_residue = self.table.get(new_rank)
+            step = (new_residue - self.residue) % 3
+            self.remaining += 1 if step == 1 else -1 if step == 2 else 0
+            self.rank, self.residue = new_rank, new_residue
+        return self.remaining
+
+    def wasted_moves(self, moves):
+        """ Moves made beyond what an optimal player would still need. """
+
+        return moves + self.remaining - self.start_distance
+
+
+def make_oracle(start, goal, burnt):
+    """ Return a DistanceOracle for this game, or None if there is no
+        table for its stack size.
+    """
+
+    table = goal_table(len(start), burnt)
+    if table is None:
+        return None
+    return DistanceOracle(start, goal, burnt, table)
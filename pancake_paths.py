@@ -0,0 +1,152 @@
+"""
+pancake_paths.py
+Count the optimal flip sequences of a stack without listing them, and
+pick one of them uniformly at random. A stack with many optimal
+solutions is forgiving; one with a single solution is not.
+"""
+
+import argparse
+import random
+
+from pancake_oracle import goal_table
+from pancake_ranking import rank
+from pancake_relabel import normalise
+from pancake_strategies import flip_order
+
+
+# --- Classes ---
+class OptimalPaths:
+    """ This class lays the shortest paths from start to goal out as a
+        DAG of levels, level d holding every stack d flips from start on
+        some optimal path, with the number of optimal ways to reach it
+        (Python integers, so the counts never overflow). Each stack is
+        expanded once, so the work is linear in the stacks explored.
+        With a distance table the levels follow the table downhill and
+        hold only stacks on optimal paths. Without one they are the
+        levels of a Breadth First Search from start.
+    """
+
+    def __init__(self, start, goal, burnt, table=None):
+        self.start = start
+        self.goal = goal
+        self.burnt = burnt
+        self.order = normalise(start, goal)
+        self.table = table if table is not None else goal_table(len(start), burnt)
+        self.first_flip = 1 if burnt else 2
+        self.levels = []        # Per distance: {state: optimal ways to reach it}
+        self.states_explored = 0
+
+        if self.table is not None:
+            self.count_downhill()
+        else:
+            self.count_breadth_first()
+
+    @property
+    def fewest_moves(self):
+        return len(self.levels) - 1
+
+    @property
+    def count(self):
+        """ The number of distinct optimal flip sequences. """
+
+        return self.levels[-1][self.goal_state]
+
+    def neighbors(self, state):
+        """ [(n_to_flip, state), ...]: ranks with a table, tuples
+            without.
+        """
+
+        if self.table is not None:
+            return self.table.neighbors(state)
+        return [
+            (n_to_flip, tuple(flip_order(list(state), n_to_flip, self.burnt)))
+            for n_to_flip in range(self.first_flip, len(state) + 1)
+        ]
+
+    def count_downhill(self):
+        """ Follow the table: the next level is every neighbour whose
+            distance mod 3 is one less.
+        """
+
+        self.goal_state = 0
+        state = rank(self.order, self.burnt)
+        level = {state: 1}
+        residue = self.table.get(state)
+        while self.goal_state not in level:
+            self.levels.append(level)
+            residue = (residue - 1) % 3
+            following = {}
+            for state, ways in level.items():
+                self.states_explored += 1
+                for n_to_flip, neighbor in self.neighbors(state):
+                    if self.table.get(neighbor) == residue:
+                        following[neighbor] = following.get(neighbor, 0) + ways
+            level = following
+        self.levels.append(level)
+
+    def count_breadth_first(self):
+        """ Search outward from start until the level holding the goal
+            is complete.
+        """
+
+        self.goal_state = tuple(range(1, len(self.order) + 1))
+        level = {tuple(self.order): 1}
+        seen = set(level)
+        while self.goal_state not in level:
+            self.levels.append(level)
+            following = {}
+            for state, ways in level.items():
+                self.states_explored += 1
+                for n_to_flip, neighbor in self.neighbors(state):
+                    if neighbor in following:
+                        following[neighbor] += ways
+                    elif neighbor not in seen:
+                        following[neighbor] = ways
+            seen.update(following)
+            level = following
+        self.levels.append(level)
+
+    def sample(self, rng=random):
+        """ Return one optimal flip sequence, each equally likely. Walk
+            back from the goal, stepping to each predecessor in
+            proportion to the ways of reaching it.
+        """
+
+        flips = []
+        state = self.goal_state
+        for depth in range(self.fewest_moves, 0, -1):
+            previous = self.levels[depth - 1]
+            pick = rng.randrange(self.levels[depth][state])
+            for n_to_flip, neighbor in self.neighbors(state):
+                ways = previous.get(neighbor, 0)
+                if pick < ways:
+                    break
+                pick -= ways
+            flips.append(n_to_flip)
+            state = neighbor
+        flips.reverse()
+        return flips
+
+
+# --- Functions ---
+def count_optimal_paths(start, goal, burnt, table=None):
+    return OptimalPaths(start, goal, burnt, table).count
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="Count the optimal solutions of a stack.")
+    parser.add_argument("stack", type=int, nargs="+", help="pancakes from the top, e.g. 3 -1 2")
+    parser.add_argument("--burnt", action="store_true")
+    parser.add_argument("--sample", type=int, default=0, help="print this many random optimal solutions")
+    args = parser.parse_args()
+
+    goal = list(range(1, len(args.stack) + 1))
+    paths = OptimalPaths(args.stack, goal, args.burnt)
+    print(paths.fewest_moves, "moves,", paths.count, "optimal solutions,",
+          paths.states_explored, "stacks explored")
+    for i in range(args.sample):
+        print(paths.sample())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+pancake_pdb.py
+Additive pattern databases: a stronger heuristic than the gap count for
+HeuristicSearch, mostly aimed at the burnt variant.
+"""
+
+import os
+from collections import deque
+
+from pancake_search import gap_heuristic
+from pancake_shared import attach_or_publish, unpublish
+
+PDB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pdb")
+PDB_MAGIC = b"PDB1"
+MAX_STORED = 15     # Distances are stored in 4 bits; capping keeps them admissible
+
+
+# --- Functions ---
+def locate_pancakes(order):
+    """ Map each pancake size to its (position, sign) in order. """
+
+    where = {}
+    for i, value in enumerate(order):
+        where[abs(value)] = (i, 1 if value > 0 else -1)
+    return where
+
+
+# --- Classes ---
+class PatternDatabase:
+    """ This class holds the exact distance-to-goal of every abstract
+        stack for one pattern, a subset of the pancakes. An abstract
+        stack only records where the pattern pancakes are (and, when
+        burnt, which side is up); every other pancake is "don't care".
+        To keep several databases additive, each flip is charged to the
+        pattern that owns the pancake on top of the stack before the
+        flip. Any real solution then pays each pattern at least its
+        database value, so the values of disjoint patterns can be
+        summed without overestimating.
+        Distances are packed two per byte.
+    """
+
+    def __init__(self, stack_size, pattern, burnt, table=None):
+        self.stack_size = stack_size
+        self.pattern = tuple(sorted(pattern))
+        self.burnt = burnt
+        self.table = table
+
+        # Number of abstract stacks: n! / (n-k)! placements, times 2^k
+        # sign choices when burnt
+        k = len(self.pattern)
+        self.size = 1
+        for i in range(k):
+            self.size *= stack_size - i
+        if burnt:
+            self.size *= 2 ** k
+
+    def rank(self, positions, signs):
+        """ Map the positions (0-indexed) and signs (+1/-1) of the
+            pattern pancakes to a unique index.
+        """
+
+        index = 0
+        for i, pos in enumerate(positions):
+            # Positions already taken by earlier pattern pancakes are
+            # skipped, giving a mixed-radix number with digit i < n-i
+            smaller = 0
+            for j in range(i):
+                if positions[j] < pos:
+                    smaller += 1
+            index = index * (self.stack_size - i) + pos - smaller
+        if self.burnt:
+            for sign in signs:
+                index = index * 2 + (1 if sign < 0 else 0)
+        return index
+
+    def abstract(self, where):
+        """ Project a real stack (goal (1, 2, ..., n)) onto the pattern.
+            where maps each pancake size to its (position, sign), see
+            locate_pancakes.
+        """
+
+        positions = [where[p][0] for p in self.pattern]
+        signs = [where[p][1] for p in self.pattern]
+        return positions, signs
+
+    def build(self):
+        """ Compute every abstract distance with a 0-1 BFS outward from
+            the abstract goal. Flips are their own inverse, so we walk
+            backwards: the predecessor of t by a flip of k pancakes is
+            flip(t, k), and that move cost 1 if the pancake at position
+            k-1 of t (the top of the predecessor) is a pattern pancake.
+        """
+
+        n = self.stack_size
+        dist = bytearray([255]) * self.size
+        goal = (tuple(p - 1 for p in self.pattern), (1,) * len(self.pattern))
+        dist[self.rank(*goal)] = 0
+        queue = deque([(goal, 0)])
+        first = 1 if self.burnt else 2
+
+        while queue:
+            (positions, signs), d = queue.popleft()
+            if d > dist[self.rank(positions, signs)]:
+                continue
+            occupied = set(positions)
+            for n_to_flip in range(first, n + 1):
+                cost = 1 if (n_to_flip - 1) in occupied else 0
+                new_positions = []
+                new_signs = []
+                for pos, sign in zip(positions, signs):
+                    if pos < n_to_flip:
+                        new_positions.append(n_to_flip - 1 - pos)
+                        new_signs.append(-sign if self.burnt else sign)
+                    else:
+                        new_positions.append(pos)
+                        new_signs.append(sign)
+                index = self.rank(new_positions, new_signs)
+                if d + cost < dist[index]:
+                    dist[index] = d + cost
+                    state = ((tuple(new_positions), tuple(new_signs)), d + cost)
+                    if cost == 0:
+                        queue.appendleft(state)
+                    else:
+                        queue.append(state)
+
+        # Pack two 4-bit distances per byte
+        self.table = bytearray((self.size + 1) // 2)
+        for index in range(self.size):
+            value = min(dist[index], MAX_STORED)
+            if index % 2:
+                self.table[index // 2] |= value << 4
+            else:
+                self.table[index // 2] |= value
+
+    def lookup(self, where):
+        """ Return the abstract distance of a real stack, given as the
+            output of locate_pancakes.
+        """
+
+        index = self.rank(*self.abstract(where))
+        byte = self.table[index // 2]
+        return (byte >> 4) if index % 2 else (byte & 15)
+
+    def filename(self):
+        variant = "burned" if self.burnt else "regular"
+        name = "_".join([str(p) for p in self.pattern])
+        return variant + "-n" + str(self.stack_size) + "-" + name + ".pdb"
+
+    def save(self, directory=PDB_DIR):
+        """ Write the packed table, behind a short header. """
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename())
+        unpublish(path)
+        with open(path, "wb") as f:
+            f.write(PDB_MAGIC)
+            f.write(bytes([self.stack_size, int(self.burnt), len(self.pattern)]))
+            f.write(bytes(self.pattern))
+            f.write(self.table)
+
+    def read_file(self, directory=PDB_DIR):
+        """ Return the bytes saved by save, or None if there are none. """
+
+        path = os.path.join(directory, self.filename())
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def load(self, directory=PDB_DIR, shared=True):
+        """ Read the packed table written by save. Return False if
+            there is no file for this pattern. With shared, the table
+            is attached from shared memory (and published there by the
+            first process on the machine to load it).
+        """
+
+        if shared:
+            data = attach_or_publish(os.path.join(directory, self.filename()))
+        else:
+            data = self.read_file(directory)
+        if data is None:
+            return False
+        header = len(PDB_MAGIC) + 3 + len(self.pattern)
+        if (data[:len(PDB_MAGIC)] != PDB_MAGIC
+            or tuple(data[len(PDB_MAGIC)+3:header]) != self.pattern):
+            raise ValueError(self.filename() + " is not a pattern database for " + str(self.pattern))
+        self.table = memoryview(data)[header:]
+        return True
+
+
+class AdditivePDBHeuristic:
+    """ This class sums the pattern databases of a partition of the
+        pancakes into groups of consecutive sizes, and takes the larger
+        of that sum and the gap heuristic. Databases are loaded from
+        disk the first time they are needed, and built (then saved) if
+        they are missing. Pass an instance as the heuristic of
+        HeuristicSearch.
+    """
+
+    def __init__(self, stack_size, burnt, pattern_size=4, directory=PDB_DIR):
+        self.stack_size = stack_size
+        self.burnt = burnt
+        self.directory = directory
+        self.patterns = [
+            tuple(range(first, min(first + pattern_size, stack_size + 1)))
+            for first in range(1, stack_size + 1, pattern_size)
+        ]
+        self.databases = None
+
+    def on_disk(self):
+        """ True if every database of the partition has been saved, so
+            that using the heuristic will not build any.
+        """
+
+        return all(
+            os.path.exists(os.path.join(
+                self.directory, PatternDatabase(self.stack_size, pattern, self.burnt).filename()
+            ))
+            for pattern in self.patterns
+        )
+
+    def load(self):
+        """ Load (or build and save) every database of the partition. """
+
+        self.databases = []
+        for pattern in self.patterns:
+            database = PatternDatabase(self.stack_size, pattern, self.burnt)
+            if not database.load(self.directory):
+                database.build()
+                database.save(self.directory)
+            self.databases.append(database)
+
+    def __call__(self, order, burnt):
+        if self.databases is None:
+            self.load()
+        where = locate_pancakes(order)
+        total = 0
+        for database in self.databases:
+            total += database.lookup(where)
+        return max(total, gap_heuristic(order, burnt))
+
+
+# --- Main function ---
+def main():
+    """ Precompute the burnt pattern databases used by the game. """
+
+    for stack_size in range(6, 13):
+        heuristic = AdditivePDBHeuristic(stack_size, burnt=True)
+        heuristic.load()
+        print("Built", len(heuristic.databases), "databases for n =", stack_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+pancake_ranking.py
+Number every stack of n pancakes with a unique integer (its rank), so
+that tables can store one entry per stack without keeping the stacks.
+"""
+
+import math
+
+
+# --- Functions ---
+def state_count(stack_size, burnt):
+    """ Number of vertices of the pancake graph: n!, or n! * 2^n. """
+
+    count = math.factorial(stack_size)
+    if burnt:
+        count *= 2 ** stack_size
+    return count
+
+
+def rank(order, burnt):
+    """ Rank a stack. Plain stacks get their lexicographic rank among
+        the n! permutations; burnt stacks add the signs as n low bits
+        (bit i set if the pancake at position i is burnt side up).
+        The sorted stack (1, 2, ..., n) always has rank 0.
+    """
+
+    n = len(order)
+    sizes = [abs(v) for v in order]
+    index = 0
+    for i in range(n):
+        # Lehmer code: how many smaller pancakes are still below
+        smaller = 0
+        for j in range(i + 1, n):
+            if sizes[j] < sizes[i]:
+                smaller += 1
+        index = index * (n - i) + smaller
+    if burnt:
+        for v in order:
+            index = index * 2 + (1 if v < 0 else 0)
+    return index
+
+
+def unrank(index, stack_size, burnt):
+    """ Inverse of rank: return the stack with the given rank. """
+
+    signs = []
+    if burnt:
+        for i in range(stack_size):
+            signs.append(-1 if index & 1 else 1)
+            index >>= 1
+        signs.reverse()
+    else:
+        signs = [1] * stack_size
+
+    # Read the Lehmer code back from the mixed-radix number
+    digits = []
+    for radix in range(1, stack_size + 1):
+        digits.append(index % radix)
+        index //= radix
+    digits.reverse()
+
+    remaining = list(range(1, stack_size + 1))
+    order = []
+    for digit, sign in zip(digits, signs):
+        order.append(remaining.pop(digit) * sign)
+    return order
+
+
+def flip(order, n_to_flip, burnt):
+    """ Return a copy of order with the top n_to_flip pancakes flipped. """
+
+    top = order[n_to_flip-1::-1]
+    if burnt:
+        top = [-v for v in top]
+    return top + order[n_to_flip:]
@@ -0,0 +1,121 @@
+"""
+pancake_relabel.py
+Answer any start-to-goal query with identity-rooted results, by
+renaming the pancakes so that the goal becomes (1, 2, ..., n).
+"""
+
+
+# --- Functions ---
+def normalise(start, goal):
+    """ Return goal^-1 o start: start with each pancake renamed to its
+        (signed) position in goal. The pancake graph is a Cayley graph
+        (flips act on positions, names only ride along), so the
+        distance and every flip sequence from start to goal are the
+        same as from the result to the identity.
+        In the burnt case a pancake that sits burnt side up in goal is
+        renamed with a minus sign, so it is "sorted" once it matches
+        its side in goal.
+    """
+
+    position = {}
+    for i, value in enumerate(goal):
+        position[abs(value)] = (i + 1) if value > 0 else -(i + 1)
+    return [position[abs(v)] if v > 0 else -position[abs(v)] for v in start]
+
+
+def restore(order, goal):
+    """ Undo normalise: rename an identity-rooted stack back into the
+        pancakes of goal (restore(normalise(s, g), g) == s).
+    """
+
+    return [goal[abs(v) - 1] if v > 0 else -goal[abs(v) - 1] for v in order]
+
+
+def apply_flips(order, flips, burnt):
+    """ Return the list of stacks visited by flipping order by each
+        number of pancakes in flips, starting with order itself.
+    """
+
+    sequence = [list(order)]
+    for n_to_flip in flips:
+        current = sequence[-1]
+        top = current[n_to_flip-1::-1]
+        if burnt:
+            top = [-v for v in top]
+        sequence.append(top + current[n_to_flip:])
+    return sequence
+
+
+# --- Classes ---
+class Solution:
+    """ The answer to one start-to-goal query, with the same
+        fewest_moves and best_path attributes as Graph.
+    """
+
+    def __init__(self, start, goal, burnt, flips):
+        self.start = start
+        self.goal = goal
+        self.burnt = burnt
+        self.flips = flips
+        self.fewest_moves = len(flips)
+        self.best_path = [
+            ":".join([str(i) for i in order])
+            for order in apply_flips(start, flips, burnt)
+        ]
+
+
+class IdentityCache:
+    """ This class answers (start, goal) queries from a single cache
+        keyed by the normalised stack, so solving a stack for one goal
+        also solves every other (start, goal) pair with the same
+        relative order. Custom targets, such as largest-on-top, are
+        lookups rather than new searches.
+        solver_class is constructed as solver_class(start, goal, burnt)
+        with the identity as goal, and must fill in best_path after
+        search() or BFS(), like HeuristicSearch or Graph.
+    """
+
+    def __init__(self, solver_class):
+        self.solver_class = solver_class
+        self.solutions = {}     # (vertex_key, burnt) -> list of flips
+        self.hits = 0
+        self.misses = 0
+
+    def flips_from_path(self, best_path):
+        """ Recover how many pancakes were flipped at each step of a
+            path of vertex_keys (the deepest position that changed).
+        """
+
+        flips = []
+        orders = [[int(i) for i in key.split(":")] for key in best_path]
+        for before, after in zip(orders, orders[1:]):
+            n_to_flip = len(before)
+            while n_to_flip > 1 and before[n_to_flip-1] == after[n_to_flip-1]:
+                n_to_flip -= 1
+            flips.append(n_to_flip)
+        return flips
+
+    def solve(self, start, goal, burnt):
+        """ Return a Solution from start to goal, searching only if the
+            normalised stack has not been solved before.
+        """
+
+        order = normalise(start, goal)
+        key = (":".join([str(i) for i in order]), burnt)
+        if key in self.solutions:
+            self.hits += 1
+        else:
+            self.misses += 1
+            solver = self.solver_class(order, list(range(1, len(order) + 1)), burnt)
+            if hasattr(solver, "search"):
+                solver.search()
+            else:
+                solver.BFS()
+            if hasattr(solver, "flips"):
+                self.solutions[key] = list(solver.flips)
+            else:
+                self.solutions[key] = self.flips_from_path(solver.best_path)
+        return Solution(list(start), list(goal), burnt, self.solutions[key])
+
+    def distance(self, start, goal, burnt):
+        return self.solve(start, goal, burnt).fewest_moves
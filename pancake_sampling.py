@@ -0,0 +1,247 @@
+"""
+pancake_sampling.py
+Estimate how far stacks are from sorted when there are too many of them
+to sweep: solve uniformly random stacks exactly, across a pool of
+processes, and report the mean and the distribution of their distances
+with confidence intervals as the samples come in. Runs are checkpointed,
+so a long one can be stopped and resumed.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+
+from pancake_pdb import AdditivePDBHeuristic
+from pancake_ranking import state_count, unrank
+from pancake_search import HeuristicSearch
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "samples")
+CHECKPOINT_EVERY = 30.0     # Seconds between checkpoints
+Z_95 = 1.959964             # Standard normal quantile for 95% intervals
+
+# Heuristic of each worker process, built once per (stack size, variant)
+_heuristics = {}
+
+
+# --- Classes ---
+class DistanceEstimate:
+    """ Running estimate of the distance distribution of one stack size
+        and variant, from exactly solved uniform samples. The mean gets
+        a normal confidence interval; the share of stacks at each
+        distance gets a Wilson score interval, which stays inside [0, 1]
+        and behaves for distances that are rare or not yet seen.
+        The largest distance seen is a lower bound on the diameter.
+    """
+
+    def __init__(self, stack_size, burnt, counts=None):
+        self.stack_size = stack_size
+        self.burnt = burnt
+        self.counts = dict(counts) if counts else {}    # distance -> samples
+
+    @property
+    def samples(self):
+        return sum(self.counts.values())
+
+    @property
+    def largest(self):
+        return max(self.counts) if self.counts else None
+
+    def add(self, distance):
+        self.counts[distance] = self.counts.get(distance, 0) + 1
+
+    def mean(self):
+        return sum(d * c for d, c in self.counts.items()) / self.samples
+
+    def stdev(self):
+        """ Sample standard deviation (0 for fewer than two samples). """
+
+        samples = self.samples
+        if samples < 2:
+            return 0.0
+        mean = self.mean()
+        return math.sqrt(
+            sum(c * (d - mean) ** 2 for d, c in self.counts.items()) / (samples - 1)
+        )
+
+    def mean_interval(self, z=Z_95):
+        """ (low, high) confidence interval of the mean distance. """
+
+        half = z * self.stdev() / math.sqrt(self.samples)
+        return self.mean() - half, self.mean() + half
+
+    def share_interval(self, distance, z=Z_95):
+        """ (share, low, high): the fraction of stacks at distance, with
+            its Wilson score interval.
+        """
+
+        samples = self.samples
+        share = self.counts.get(distance, 0) / samples
+        centre = (share + z * z / (2 * samples)) / (1 + z * z / samples)
+        half = (z / (1 + z * z / samples)) * math.sqrt(
+            share * (1 - share) / samples + z * z / (4 * samples * samples)
+        )
+        return share, max(0.0, centre - half), min(1.0, centre + half)
+
+    def progress_line(self):
+        low, high = self.mean_interval()
+        return "{} samples, mean {:.3f} (95% CI {:.3f} to {:.3f}), largest {}".format(
+            self.samples, self.mean(), low, high, self.largest
+        )
+
+    def summary(self):
+        lines = [
+            ("burned " if self.burnt else "regular ") + str(self.stack_size)
+            + ": " + self.progress_line()
+        ]
+        for distance in range(min(self.counts), self.largest + 1):
+            share, low, high = self.share_interval(distance)
+            lines.append("    distance {:2}: {:7} ({:6.2%}, 95% CI {:6.2%} to {:6.2%})".format(
+                distance, self.counts.get(distance, 0), share, low, high
+            ))
+        return "\n".join(lines)
+
+
+# --- Functions ---
+def checkpoint_path(stack_size, burnt, directory=SAMPLE_DIR):
+    variant = "burned" if burnt else "regular"
+    return os.path.join(directory, variant + "-n" + str(stack_size) + ".json")
+
+
+def make_heuristic(stack_size, burnt):
+    """ The gap heuristic for regular stacks (None lets HeuristicSearch
+        use it) and additive pattern databases for burnt ones, where
+        the gap heuristic is far too weak at these sizes.
+    """
+
+    if not burnt:
+        return None
+    key = (stack_size, burnt)
+    if key not in _heuristics:
+        heuristic = AdditivePDBHeuristic(stack_size, burnt)
+        heuristic.load()
+        _heuristics[key] = heuristic
+    return _heuristics[key]
+
+
+def draw_stack(index, stack_size, burnt, seed):
+    """ The index-th sample of a run: a uniformly random stack that
+        depends only on (seed, index), so a resumed run draws the same
+        stacks as one that was never stopped.
+    """
+
+    rng = random.Random(seed << 32 | index)
+    return unrank(rng.randrange(state_count(stack_size, burnt)), stack_size, burnt)
+
+
+def solve_sample(job):
+    """ Worker: draw one sample and return its exact distance. """
+
+    index, stack_size, burnt, seed = job
+    order = draw_stack(index, stack_size, burnt, seed)
+    solver = HeuristicSearch(
+        order, list(range(1, stack_size + 1)), burnt, make_heuristic(stack_size, burnt)
+    )
+    solver.search()
+    return solver.fewest_moves
+
+
+def load_checkpoint(path, stack_size, burnt, seed):
+    """ Return (samples done, DistanceEstimate) from a checkpoint, or a
+        fresh start if there is none. A checkpoint of another run is an
+        error rather than something to mix in.
+    """
+
+    if not os.path.exists(path):
+        return 0, DistanceEstimate(stack_size, burnt)
+    with open(path) as f:
+        saved = json.load(f)
+    if (saved["stack_size"], saved["burnt"], saved["seed"]) != (stack_size, burnt, seed):
+        raise ValueError(path + " is a checkpoint of another run")
+    counts = {int(distance): count for distance, count in saved["counts"].items()}
+    return saved["next_index"], DistanceEstimate(stack_size, burnt, counts)
+
+
+def save_checkpoint(path, seed, next_index, estimate):
+    """ Write the checkpoint beside the old one and then swap it in, so
+        a run stopped mid-write still leaves a whole checkpoint.
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    saved = {
+        "stack_size": estimate.stack_size,
+        "burnt": estimate.burnt,
+        "seed": seed,
+        "next_index": next_index,
+        "counts": {str(distance): count for distance, count in sorted(estimate.counts.items())},
+    }
+    with open(path + ".tmp", "w") as f:
+        json.dump(saved, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def sample_distances(stack_size, burnt, samples, processes=None, seed=0, path=None,
+                     checkpoint_every=CHECKPOINT_EVERY):
+    """ Solve samples random stacks across a process pool, resuming from
+        the checkpoint at path (by default under data/samples/). Yield
+        (distance, estimate) as each sample is solved. Results are taken
+        in sample order, so the checkpoint only needs the number done.
+    """
+
+    path = path or checkpoint_path(stack_size, burnt)
+    done, estimate = load_checkpoint(path, stack_size, burnt, seed)
+    if burnt:
+        # Build any missing databases here, once, rather than in every worker
+        make_heuristic(stack_size, burnt)
+    jobs = ((index, stack_size, burnt, seed) for index in range(done, samples))
+
+    last_saved = time.monotonic()
+    try:
+        with multiprocessing.Pool(processes) as pool:
+            for distance in pool.imap(solve_sample, jobs, chunksize=4):
+                estimate.add(distance)
+                done += 1
+                if time.monotonic() - last_saved >= checkpoint_every:
+                    save_checkpoint(path, seed, done, estimate)
+                    last_saved = time.monotonic()
+                yield distance, estimate
+    finally:
+        save_checkpoint(path, seed, done, estimate)
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(
+        description="Estimate the distance distribution of large stacks by sampling."
+    )
+    parser.add_argument("stack_size", type=int)
+    parser.add_argument("--burnt", action="store_true")
+    parser.add_argument("--samples", type=int, default=1000, help="total samples, counting resumed ones")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default under data/samples/)")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    estimate = None
+    last_report = time.monotonic()
+    try:
+        for distance, estimate in sample_distances(
+            args.stack_size, args.burnt, args.samples, args.processes, args.seed, args.checkpoint
+        ):
+            if time.monotonic() - last_report >= args.report_every:
+                print(estimate.progress_line(), flush=True)
+                last_report = time.monotonic()
+    except KeyboardInterrupt:
+        print("Stopped; run again to resume.")
+    if estimate is None:
+        path = args.checkpoint or checkpoint_path(args.stack_size, args.burnt)
+        estimate = load_checkpoint(path, args.stack_size, args.burnt, args.seed)[1]
+    if estimate.samples:
+        print(estimate.summary())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+pancake_search.py
+Optimal heuristic search (IDA*) over the pancake graph, for stacks that
+are too big for Graph.BFS.
+"""
+
+import time
+
+from pancake_relabel import normalise
+from pancake_store import open_store
+from pancake_tables import open_table
+
+FOUND = -1
+GAVE_UP = -2
+CLOCK_EVERY = 16        # Expansions between looks at the clock
+
+
+# --- Heuristics ---
+def gap_heuristic(order, burnt):
+    """ Count the adjacent pairs (including the plate below the bottom
+        pancake) that are not neighbours in the sorted stack. A flip
+        changes only one adjacency, so this never overestimates.
+        Assumes the goal is (1, 2, ..., n).
+    """
+
+    n = len(order)
+    gaps = 0
+    if burnt:
+        for i in range(n - 1):
+            if order[i + 1] - order[i] != 1:
+                gaps += 1
+        if order[-1] != n:
+            gaps += 1
+    else:
+        for i in range(n - 1):
+            if abs(order[i + 1] - order[i]) != 1:
+                gaps += 1
+        if order[-1] != n:
+            gaps += 1
+    return gaps
+
+
+# --- Classes ---
+class HeuristicSearch:
+    """ This class finds a shortest flip sequence from start to goal with
+        Iterative Deepening A* (https://en.wikipedia.org/wiki/Iterative_deepening_A*).
+        It uses memory proportional to the solution length rather than
+        to the number of vertices, so it reaches much larger stacks than
+        Graph.BFS.
+        The heuristic is any function of (order, burnt) that never
+        overestimates the distance of order to (1, 2, ..., n); the gap
+        heuristic is used by default. The results are reported with the
+        same attributes as Graph: fewest_moves and best_path.
+    """
+
+    def __init__(self, start, goal, burnt, heuristic=None, node_limit=None, max_moves=None,
+                 time_limit=None):
+        self.start = start
+        self.goal = goal
+        self.burnt = burnt
+        self.heuristic = heuristic if heuristic is not None else gap_heuristic
+        self.node_limit = node_limit    # Give up after expanding this many
+        self.max_moves = max_moves      # Give up on solutions longer than this
+        self.time_limit = time_limit    # Give up after this many seconds
+        self.deadline = None
+        self.fewest_moves = None
+        self.best_path = []
+        self.flips = []         # Number of pancakes flipped at each move
+        self.nodes_expanded = 0
+
+    def flip(self, order, n_to_flip):
+        """ Flip the top n_to_flip pancakes of order in place. """
+
+        if self.burnt:
+            order[:n_to_flip] = [-v for v in order[n_to_flip-1::-1]]
+        else:
+            order[:n_to_flip] = order[n_to_flip-1::-1]
+
+    def search(self):
+        """ Raise the f-cost bound one step at a time until a
+            depth-first search within the bound reaches the goal.
+            Return False (leaving fewest_moves None) if node_limit or
+            time_limit ran out first, or if the bound passed max_moves,
+            which proves that the stack needs more than max_moves flips.
+        """
+
+        if self.time_limit is not None:
+            self.deadline = time.perf_counter() + self.time_limit
+        order = normalise(self.start, self.goal)
+        self.identity = list(range(1, len(order) + 1))
+        self.nodes_expanded = 0
+        self.flips = []
+
+        bound = self.heuristic(order, self.burnt)
+        while True:
+            if self.max_moves is not None and bound > self.max_moves:
+                return False
+            result = self._bounded_dfs(order, 0, bound, 0)
+            if result == FOUND:
+                break
+            if result == GAVE_UP:
+                self.flips = []
+                return False
+            bound = result
+
+        self.fewest_moves = len(self.flips)
+        self.best_path = self.traceback()
+        return True
+
+    def _bounded_dfs(self, order, moves, bound, last_flip):
+        """ Depth-first search that prunes every vertex whose moves so
+            far plus heuristic exceed bound. Return FOUND, GAVE_UP, or
+            the smallest f-cost that was pruned.
+        """
+
+        estimate = moves + self.heuristic(order, self.burnt)
+        if estimate > bound:
+            return estimate
+        if order == self.identity:
+            return FOUND
+        self.nodes_expanded += 1
+        if self.node_limit is not None and self.nodes_expanded > self.node_limit:
+            return GAVE_UP
+        if (self.deadline is not None and self.nodes_expanded % CLOCK_EVERY == 0
+                and time.perf_counter() > self.deadline):
+            return GAVE_UP
+
+        # In the regular game, flipping one pancake does nothing.
+        # Repeating the previous flip would just undo it.
+        smallest = None
+        first = 1 if self.burnt else 2
+        for n_to_flip in range(first, len(order) + 1):
+            if n_to_flip == last_flip:
+                continue
+            self.flip(order, n_to_flip)
+            self.flips.append(n_to_flip)
+            result = self._bounded_dfs(order, moves + 1, bound, n_to_flip)
+            if result == FOUND or result == GAVE_UP:
+                return result
+            self.flips.pop()
+            self.flip(order, n_to_flip)
+            if smallest is None or result < smallest:
+                smallest = result
+        return smallest
+
+    def traceback(self):
+        """ Generate a list of vertex_keys on the shortest path from
+            start to goal, like Graph.traceback.
+        """
+
+        order = list(self.start)
+        sequence = [":".join([str(i) for i in order])]
+        for n_to_flip in self.flips:
+            self.flip(order, n_to_flip)
+            sequence.append(":".join([str(i) for i in order]))
+        return sequence
+
+
+# --- Functions ---
+def optimal_flips(order, burnt, heuristic=None, node_limit=None, use_store=True):
+    """ Return an optimal flip sequence from order to (1, 2, ..., n),
+        read from a distance table if there is one, otherwise from the
+        solution store (unless use_store is False), otherwise found by
+        HeuristicSearch (and then stored). Raise TimeoutError if the
+        search expands more than node_limit stacks.
+    """
+
+    table = open_table(len(order), burnt)
+    if table is not None:
+        return table.solve(order)
+    if use_store:
+        flips = open_store().get(order, burnt)
+        if flips is not None:
+            return flips
+    solver = HeuristicSearch(
+        order, list(range(1, len(order) + 1)), burnt, heuristic, node_limit=node_limit
+    )
+    if not solver.search():
+        raise TimeoutError("no solution within " + str(node_limit) + " expansions")
+    if use_store:
+        open_store().put(order, burnt, solver.flips)
+    return solver.flips
+
+
+def is_optimal(order, burnt, flips, heuristic=None):
+    """ Return True if no sequence shorter than flips sorts order: by
+        the distance table if there is one, otherwise by a search that
+        gives up past len(flips) - 1 flips.
+    """
+
+    table = open_table(len(order), burnt)
+    if table is not None:
+        return table.distance(order) == len(flips)
+    solver = HeuristicSearch(
+        order, list(range(1, len(order) + 1)), burnt, heuristic, max_moves=len(flips) - 1
+    )
+    return not solver.search()
@@ -0,0 +1,393 @@
+"""
+pancake_service.py
+A local solver service shared by every game on the host, and the client
+that games use to call it.
+
+The service listens on a Unix socket (or localhost TCP) for one JSON
+request per line, for example
+    {"id": 1, "op": "solve", "start": [2, -1, 3], "burnt": true}
+and answers each with one JSON line carrying the same id. "op" is
+"solve" (fewest_moves and flips), "hint" (the next flip) or "distance"
+(fewest_moves); "goal" is optional and defaults to the sorted stack.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import socket
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pancake_pdb import AdditivePDBHeuristic
+from pancake_relabel import normalise
+from pancake_search import optimal_flips
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "pancake-solver.sock")
+BATCH_WINDOW = 0.002    # Seconds to wait for more requests to join a batch
+MAX_BATCH = 256
+CACHE_SIZE = 100000     # Solved stacks kept warm
+MAX_STACK = 20          # Largest stack the service will search
+NODE_LIMIT = 2000000    # Expansions before a search gives up
+
+
+# --- Classes ---
+class SolverService:
+    """ This class answers solver requests from many clients at once.
+        Requests that arrive close together are merged into a batch;
+        identical stacks (after relabelling the goal to the sorted
+        stack) are solved once for everyone who asked. Solutions,
+        opened tables and pattern databases stay warm between batches.
+        Solving runs on a worker thread so the event loop keeps
+        accepting requests.
+    """
+
+    def __init__(self, cache_size=CACHE_SIZE, batch_window=BATCH_WINDOW,
+                 max_batch=MAX_BATCH, node_limit=NODE_LIMIT):
+        self.cache = OrderedDict()  # (vertex_key, burnt) -> flips
+        self.cache_size = cache_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.node_limit = node_limit
+        self.pending = {}           # (vertex_key, burnt) -> [futures]
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.requests = 0
+
+    # --- Solving (worker thread) ---
+    def solve_one(self, order, burnt):
+        """ Return an optimal flip sequence from order to the sorted
+            stack, or raise TimeoutError if it takes more than
+            node_limit expansions, so one stack cannot hold up the
+            worker thread for everyone.
+        """
+
+        return optimal_flips(order, burnt, pdb_heuristic(len(order), burnt), self.node_limit)
+
+    def solve_batch(self, batch):
+        """ Solve a batch of distinct (order, burnt) pairs, grouped by
+            stack size and variant so that each table is found once.
+            Return {key: flips or exception}.
+        """
+
+        results = {}
+        groups = {}
+        for key, order, burnt in batch:
+            groups.setdefault((len(order), burnt), []).append((key, order))
+        for (stack_size, burnt), members in groups.items():
+            for key, order in members:
+                try:
+                    results[key] = self.solve_one(order, burnt)
+                except Exception as error:
+                    results[key] = error
+        return results
+
+    # --- Batching (event loop) ---
+    async def submit(self, order, burnt):
+        """ Return the flips for a normalised stack, joining an
+            identical request that is already waiting if there is one.
+        """
+
+        key = (":".join([str(i) for i in order]), burnt)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        future = asyncio.get_running_loop().create_future()
+        if key in self.pending:
+            self.pending[key].append(future)
+        else:
+            self.pending[key] = [future]
+            await self.queue.put((key, order, burnt))
+        return await future
+
+    async def run_batches(self):
+        """ Collect requests for up to batch_window seconds (or
+            max_batch requests), then solve them together.
+        """
+
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batches += 1
+            results = await loop.run_in_executor(self.executor, self.solve_batch, batch)
+            for key, flips in results.items():
+                futures = self.pending.pop(key, [])
+                if isinstance(flips, Exception):
+                    for future in futures:
+                        future.set_exception(flips)
+                    continue
+                self.cache[key] = flips
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+                for future in futures:
+                    future.set_result(flips)
+
+    async def answer(self, request):
+        """ Turn one request into its response. """
+
+        self.requests += 1
+        response = {"id": request.get("id")}
+        start = request.get("start")
+        burnt = bool(request.get("burnt", False))
+        error = stack_error(start, burnt)
+        if error is None:
+            goal = request.get("goal") or list(range(1, len(start) + 1))
+            error = stack_error(goal, burnt, len(start))
+        if error is not None:
+            response["error"] = error
+            return response
+        flips = await self.submit(normalise(start, goal), burnt)
+
+        op = request.get("op", "solve")
+        if op == "solve":
+            response["fewest_moves"] = len(flips)
+            response["flips"] = flips
+        elif op == "hint":
+            response["hint"] = flips[0] if flips else None
+        elif op == "distance":
+            response["fewest_moves"] = len(flips)
+        else:
+            response["error"] = "unknown op " + str(op)
+        return response
+
+    async def handle_client(self, reader, writer):
+        """ Serve one connection. Requests on a connection are answered
+            concurrently, each response tagged with its request's id.
+        """
+
+        lock = asyncio.Lock()
+
+        async def respond(request):
+            try:
+                response = await self.answer(request)
+            except Exception as error:
+                response = {"id": request.get("id"), "error": str(error)}
+            async with lock:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    async with lock:
+                        writer.write(b'{"id": null, "error": "bad request"}\n')
+                    continue
+                task = asyncio.ensure_future(respond(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+    async def serve(self, path=DEFAULT_SOCKET, port=None):
+        """ Listen on a Unix socket, or on localhost TCP if port is
+            given, until cancelled.
+        """
+
+        self.queue = asyncio.Queue()
+        batches = asyncio.ensure_future(self.run_batches())
+        if port is not None:
+            server = await asyncio.start_server(self.handle_client, "127.0.0.1", port)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            server = await asyncio.start_unix_server(self.handle_client, path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batches.cancel()
+
+
+class SolverClient:
+    """ This class calls a SolverService from ordinary (non-async) code,
+        such as Game. It keeps a small pool of open connections so that
+        several threads can make calls at once without reconnecting.
+        address is a Unix socket path or a (host, port) pair.
+    """
+
+    def __init__(self, address=DEFAULT_SOCKET, pool_size=4, timeout=30):
+        self.address = address
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+        self.next_id = 0
+        self.id_lock = threading.Lock()
+
+    def connect(self):
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.address)
+        return sock, sock.makefile("rb")
+
+    def request(self, message, timeout=None):
+        """ Send one request and wait up to timeout seconds (by default
+            the client's) for its response.
+        """
+
+        with self.id_lock:
+            self.next_id += 1
+            message = dict(message, id=self.next_id)
+
+        try:
+            connection = self.pool.get_nowait()
+        except queue.Empty:
+            connection = self.connect()
+        sock, reader = connection
+        sock.settimeout(timeout if timeout is not None else self.timeout)
+        try:
+            sock.sendall((json.dumps(message) + "\n").encode())
+            line = reader.readline()
+        except OSError:
+            sock.close()
+            raise
+        if not line:
+            sock.close()
+            raise ConnectionError("solver service closed the connection")
+
+        # A reply that is not JSON leaves the connection in an unknown
+        # state, so it is only pooled again after a good one
+        try:
+            response = json.loads(line)
+        except ValueError:
+            sock.close()
+            raise
+        try:
+            self.pool.put_nowait(connection)
+        except queue.Full:
+            sock.close()
+
+        if not isinstance(response, dict):
+            raise ValueError("bad response from solver service")
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def solve(self, start, burnt, goal=None):
+        """ Return (fewest_moves, flips) from start to goal. """
+
+        response = self.request({"op": "solve", "start": start, "goal": goal, "burnt": burnt})
+        return response["fewest_moves"], response["flips"]
+
+    def hint(self, start, burnt, goal=None):
+        """ Return how many pancakes to flip next on an optimal path. """
+
+        return self.request({"op": "hint", "start": start, "goal": goal, "burnt": burnt})["hint"]
+
+    def distance(self, start, burnt, goal=None, timeout=None):
+        return self.request(
+            {"op": "distance", "start": start, "goal": goal, "burnt": burnt}, timeout
+        )["fewest_moves"]
+
+    def close(self):
+        while True:
+            try:
+                sock, reader = self.pool.get_nowait()
+            except queue.Empty:
+                return
+            sock.close()
+
+
+# --- Functions ---
+_clients = {}
+_heuristics = {}        # stack_size -> AdditivePDBHeuristic, per process
+
+
+def pdb_heuristic(stack_size, burnt):
+    """ Pattern databases for burnt stacks too big for the gap heuristic
+        alone; None means the gap heuristic. Each process builds them
+        once and keeps them.
+    """
+
+    if not burnt or stack_size < 6:
+        return None
+    if stack_size not in _heuristics:
+        _heuristics[stack_size] = AdditivePDBHeuristic(stack_size, burnt)
+    return _heuristics[stack_size]
+
+
+def stack_error(order, burnt, stack_size=None):
+    """ Return why order is not a stack the service can solve (of
+        stack_size pancakes, if given), or None if it is one.
+    """
+
+    if not isinstance(order, list) or not order:
+        return "a stack must be a non-empty list"
+    if not all(type(value) is int for value in order):
+        return "a stack must hold whole numbers"
+    if stack_size is not None and len(order) != stack_size:
+        return "start and goal must have the same number of pancakes"
+    if len(order) > MAX_STACK:
+        return "the service solves stacks of up to " + str(MAX_STACK) + " pancakes"
+    if sorted(abs(value) for value in order) != list(range(1, len(order) + 1)):
+        return "a stack of n pancakes must hold each of 1 to n once"
+    if not burnt and min(order) < 0:
+        return "only burnt stacks can have pancakes upside down"
+    return None
+
+
+def parse_address(address):
+    """ Accept "host:port" for TCP; anything else is a socket path. """
+
+    if isinstance(address, str) and not address.startswith("/") and ":" in address:
+        host, port = address.rsplit(":", 1)
+        return (host, int(port))
+    return address
+
+
+def remote_distance(start, goal, burnt, address=None, timeout=None):
+    """ Ask the solver service for the fewest moves from start to goal,
+        with one pooled client per address. Return None if no service
+        is running there, it does not answer within timeout seconds, or
+        its answer is an error or cannot be read.
+    """
+
+    address = parse_address(address or os.environ.get("PANCAKE_SOLVER", DEFAULT_SOCKET))
+    if address not in _clients:
+        _clients[address] = SolverClient(address)
+    try:
+        return _clients[address].distance(start, burnt, goal, timeout)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="Run the local pancake solver service.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument("--port", type=int, default=None, help="listen on localhost TCP instead")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(SolverService().serve(args.socket, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
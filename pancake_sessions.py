@@ -0,0 +1,219 @@
+"""
+pancake_sessions.py
+An asyncio server that hosts many games of The Harried Waiter at once,
+one GameEngine per session, for front ends such as a local websocket
+bridge.
+
+Clients send one JSON request per line and get one JSON line back:
+    {"op": "new", "stack_size": 5, "burnt": true}  -> a new session
+    {"op": "flip", "session": 1, "n": 3}           -> flip 3 pancakes
+and likewise "state", "reset", "restart", "toggle_burntness",
+"add_pancake", "remove_pancake", "hint" and "close". Every response
+carries the state of its session.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pancake_engine import MAX_STACK, MIN_STACK, GameEngine
+from pancake_search import optimal_flips
+from pancake_service import NODE_LIMIT, pdb_heuristic
+
+SESSION_TIMEOUT = 30 * 60   # Seconds before an idle session is dropped
+
+
+# --- Functions ---
+def solve(order, burnt):
+    """ Worker: an optimal flip sequence for order, with the same
+        heuristic and expansion limit as the solver service, so no
+        stack keeps a worker for long. Raise TimeoutError past the
+        limit.
+    """
+
+    return optimal_flips(order, burnt, pdb_heuristic(len(order), burnt), NODE_LIMIT)
+
+
+# --- Classes ---
+class Session:
+    """ One player's game: the engine plus the optimal solution of its
+        start, which arrives later from a worker process.
+    """
+
+    __slots__ = ("engine", "fewest_moves", "last_active", "solving")
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.fewest_moves = None
+        self.last_active = time.monotonic()
+        self.solving = None     # Future for fewest_moves, while it runs
+
+    def state(self, session_id):
+        engine = self.engine
+        return {
+            "session": session_id,
+            "stack_size": engine.stack_size,
+            "burnt": engine.burnt,
+            "start_order": engine.start_order,
+            "current_order": engine.current_order,
+            "goal_order": engine.goal_order,
+            "moves": engine.moves,
+            "game_over": engine.game_over,
+            "fewest_moves": self.fewest_moves,
+        }
+
+
+class SessionServer:
+    """ This class holds every session in one process. Moves are plain
+        list operations on the event loop; searches run in a process
+        pool, so a hard stack never delays anyone else's moves.
+    """
+
+    # Requests that change the stack and need a fresh solution
+    TRANSITIONS = ("restart", "toggle_burntness", "add_pancake", "remove_pancake")
+
+    def __init__(self, workers=None, session_timeout=SESSION_TIMEOUT):
+        self.sessions = {}
+        self.next_id = 0
+        self.session_timeout = session_timeout
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def new_session(self, stack_size, burnt):
+        self.next_id += 1
+        session = Session(GameEngine(stack_size, burnt))
+        self.sessions[self.next_id] = session
+        self.start_solving(session)
+        return self.next_id
+
+    def start_solving(self, session):
+        """ Solve the session's start in the background. A solve for a
+            stack the player has since moved on from is cancelled if it
+            has not started, and its answer ignored if it has.
+        """
+
+        engine = session.engine
+        start = list(engine.start_order)
+        session.fewest_moves = None
+        if session.solving is not None:
+            session.solving.cancel()
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, solve, start, engine.burnt
+        )
+        session.solving = future
+
+        def done(future):
+            if session.solving is future and not future.cancelled():
+                session.solving = None
+                if future.exception() is None:
+                    session.fewest_moves = len(future.result())
+        future.add_done_callback(done)
+
+    async def handle(self, request):
+        """ Apply one request and return the response. """
+
+        if not isinstance(request, dict):
+            return {"error": "bad request: not a JSON object"}
+        op = request.get("op")
+        if op == "new":
+            stack_size = int(request.get("stack_size", 4))
+            burnt = bool(request.get("burnt", False))
+            if not MIN_STACK[burnt] <= stack_size <= MAX_STACK:
+                return {"error": "stack_size must be from " + str(MIN_STACK[burnt])
+                        + " to " + str(MAX_STACK)}
+            session_id = self.new_session(stack_size, burnt)
+            return self.sessions[session_id].state(session_id)
+
+        session_id = request.get("session")
+        session = self.sessions.get(session_id)
+        if session is None:
+            return {"session": session_id, "error": "no such session"}
+        session.last_active = time.monotonic()
+        engine = session.engine
+
+        if op == "flip":
+            n_to_flip = int(request["n"])
+            if not 0 < n_to_flip <= engine.stack_size:
+                return {"session": session_id, "error": "bad flip"}
+            engine.flip(n_to_flip)
+        elif op == "reset":
+            engine.reset()
+        elif op in self.TRANSITIONS:
+            getattr(engine, op)()
+            self.start_solving(session)
+        elif op == "hint":
+            try:
+                flips = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, solve, list(engine.current_order), engine.burnt
+                )
+            except TimeoutError:
+                return {"session": session_id, "error": "no hint: the stack is too hard to solve"}
+            response = session.state(session_id)
+            response["hint"] = flips[0] if flips else None
+            return response
+        elif op == "close":
+            if session.solving is not None:
+                session.solving.cancel()
+            del self.sessions[session_id]
+            return {"session": session_id, "closed": True}
+        elif op != "state":
+            return {"session": session_id, "error": "unknown op " + str(op)}
+        return session.state(session_id)
+
+    async def handle_client(self, reader, writer):
+        """ Serve one connection; it may drive any number of sessions. """
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError) as error:
+                    response = {"error": "bad request: " + str(error)}
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def expire_sessions(self):
+        """ Drop sessions nobody has touched for session_timeout. """
+
+        while True:
+            await asyncio.sleep(min(60, self.session_timeout))
+            cutoff = time.monotonic() - self.session_timeout
+            for session_id in [
+                i for i, session in self.sessions.items() if session.last_active < cutoff
+            ]:
+                if self.sessions[session_id].solving is not None:
+                    self.sessions[session_id].solving.cancel()
+                del self.sessions[session_id]
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        expiry = asyncio.ensure_future(self.expire_sessions())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            expiry.cancel()
+            self.executor.shutdown(wait=False)
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="Host many pancake flipping sessions.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="solver processes")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(SessionServer(args.workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+pancake_shared.py
+Publish precomputed tables once per machine in shared memory, so that
+every game and solver process on the host maps the same copy.
+"""
+
+import argparse
+import glob
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+
+# Files in /dev/shm live in memory and are shared by every process that
+# maps them, like multiprocessing.shared_memory (which uses the same
+# place) but without tying the table's lifetime to the process that
+# created it.
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SEGMENT_PREFIX = "pancake_"
+# The path of the file each segment was copied from, so that copies of
+# files that were rebuilt, moved or deleted can be found and removed
+SOURCES_DIR = os.path.join(SHARED_DIR, "pancake-sources")
+
+# Tables this process has mapped, kept so they stay mapped
+_segments = {}
+
+
+# --- Functions ---
+def segment_path(name):
+    return os.path.join(SHARED_DIR, SEGMENT_PREFIX + name.replace("/", "_"))
+
+
+def source_prefix(path):
+    """ The start of the segment names of every version of a file:
+        its name and a hash of its full path, so that two directories
+        holding files of the same name never share a segment.
+    """
+
+    path = os.path.realpath(path)
+    return os.path.basename(path) + "." + hashlib.sha1(path.encode()).hexdigest()[:12] + "."
+
+
+def segment_name(path, stat):
+    """ Name of the segment for the file as it is now. A rebuilt file
+        has a new size or modification time, so it gets a new segment
+        instead of the stale one.
+    """
+
+    return source_prefix(path) + "{:x}-{:x}".format(stat.st_size, stat.st_mtime_ns)
+
+
+def source_record(prefix):
+    return os.path.join(SOURCES_DIR, prefix)
+
+
+def write_atomically(path, directory, write):
+    """ Write a file in directory under a temporary name with write(f),
+        then rename it to path, so readers never see half of it.
+    """
+
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=SEGMENT_PREFIX + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def record_source(path):
+    record = source_record(source_prefix(path))
+    if not os.path.exists(record):
+        os.makedirs(SOURCES_DIR, exist_ok=True)
+        write_atomically(record, SOURCES_DIR, lambda f: f.write(os.path.realpath(path).encode()))
+
+
+def map_file(path):
+    """ Map a file read-only. The page cache shares it between processes
+        too, only without a copy that outlives the file.
+    """
+
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def attach(name):
+    """ Return a read-only mapping of a published table, or None if no
+        process has published it yet.
+    """
+
+    path = segment_path(name)
+    if path not in _segments:
+        try:
+            _segments[path] = map_file(path)
+        except FileNotFoundError:
+            return None
+    return _segments[path]
+
+
+def publish(name, source):
+    """ Copy the file source into shared memory and return a read-only
+        mapping of it. The copy is written under a temporary name and
+        renamed into place, so other processes never see half a table;
+        if two processes publish at once, both end up with the same
+        contents. Every stale segment on the host, including older
+        versions of this file, is removed.
+    """
+
+    path = segment_path(name)
+    record_source(source)
+
+    def copy(f):
+        with open(source, "rb") as g:
+            shutil.copyfileobj(g, f, 1 << 20)
+
+    write_atomically(path, SHARED_DIR, copy)
+    view = attach(name)
+    remove_stale()
+    return view
+
+
+def attach_or_publish(path):
+    """ Return a read-only mapping of the file at path that every
+        process on the host shares, or None if there is no such file.
+        The first process to ask for the file as it is now publishes it
+        in shared memory. If shared memory is full (Docker gives
+        /dev/shm only 64 MB by default) or missing, the file itself is
+        mapped instead.
+    """
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    name = segment_name(path, stat)
+    try:
+        view = attach(name)
+        if view is None:
+            view = publish(name, path)
+    except OSError:
+        view = map_file(path)
+    return view
+
+
+def remove_segment(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def unpublish(path):
+    """ Remove every published version of the file at path from shared
+        memory. Processes that already have it mapped keep their copy
+        until they exit.
+    """
+
+    prefix = source_prefix(path)
+    for segment in glob.glob(segment_path(prefix) + "*"):
+        remove_segment(segment)
+    remove_segment(source_record(prefix))
+
+
+def published():
+    """ Return [(segment path, bytes), ...] for every published table. """
+
+    return [
+        (path, os.path.getsize(path))
+        for path in sorted(glob.glob(os.path.join(SHARED_DIR, SEGMENT_PREFIX + "*")))
+    ]
+
+
+def is_stale(segment):
+    """ A segment is stale when the file it was copied from no longer
+        exists or has changed since, or when nothing records where it
+        came from.
+    """
+
+    name = os.path.basename(segment)[len(SEGMENT_PREFIX):]
+    prefix = name[:name.rfind(".") + 1]
+    try:
+        with open(source_record(prefix), "rb") as f:
+            source = f.read().decode()
+        return segment_name(source, os.stat(source)) != name
+    except (OSError, UnicodeDecodeError):
+        return True
+
+
+def remove_stale():
+    """ Remove every stale segment and the records of files that are
+        gone, and return [(segment path, bytes), ...] of what was freed.
+    """
+
+    removed = []
+    for segment, size in published():
+        if is_stale(segment):
+            remove_segment(segment)
+            removed.append((segment, size))
+    for record in glob.glob(os.path.join(SOURCES_DIR, "*")):
+        try:
+            with open(record, "rb") as f:
+                source = f.read().decode()
+        except (OSError, UnicodeDecodeError):
+            continue
+        if not os.path.exists(source):
+            remove_segment(record)
+    return removed
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="List or remove tables published in shared memory.")
+    parser.add_argument("command", choices=["list", "clear"])
+    parser.add_argument("--stale", action="store_true",
+                        help="only remove copies of files that have changed or are gone")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for path, size in published():
+            print(path, size, "bytes" + (" (stale)" if is_stale(path) else ""))
+    elif args.stale:
+        for path, size in remove_stale():
+            print("removed", path, size, "bytes")
+    else:
+        for path, size in published():
+            remove_segment(path)
+            print("removed", path, size, "bytes")
+        shutil.rmtree(SOURCES_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+pancake_stack.py
+A stack of pancakes stored as an implicit treap, so that flips of any
+size cost O(log n) instead of O(n).
+"""
+
+import random
+
+
+# --- Classes ---
+class _Node:
+    """ One pancake in the treap. The key of a node is implicit: it is
+        the number of nodes to its left (its position in the stack).
+        Reversal and sign inversion are stored as lazy tags that are
+        pushed down to the children only when we need to look inside.
+    """
+
+    __slots__ = ("value", "priority", "size", "left", "right", "parent",
+                 "rev", "neg")
+
+    def __init__(self, value):
+        self.value = value
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.rev = False    # Children (and their subtrees) are swapped
+        self.neg = False    # Signs of the whole subtree are inverted
+
+
+class PancakeStack:
+    """ This class represents a stack of pancakes, top of the stack
+        first, using the same signed integers as Graph and Game (a
+        negative pancake is burnt side up).
+        Flipping, reading a position, and finding where a pancake sits
+        are all O(log n). The class also behaves like a list (len,
+        indexing, iteration, comparison with lists), so solvers and
+        replays can take either form.
+    """
+
+    def __init__(self, order, burnt=False):
+        self.burnt = burnt
+        self.nodes = {}     # abs(value) -> _Node, for "where is v?"
+        self.root = self._build(order)
+
+    # --- Treap internals ---
+    def _build(self, order):
+        """ Build a treap from a list in O(n) using the right spine of
+            a Cartesian tree on the random priorities.
+        """
+
+        spine = []
+        for value in order:
+            node = _Node(value)
+            self.nodes[abs(value)] = node
+            last = None
+            while spine and spine[-1].priority < node.priority:
+                last = spine.pop()
+                self._update(last)
+            node.left = last
+            if last is not None:
+                last.parent = node
+            if spine:
+                spine[-1].right = node
+                node.parent = spine[-1]
+            spine.append(node)
+
+        while spine:
+            root = spine.pop()
+            self._update(root)
+        if not order:
+            return None
+        root.parent = None
+        return root
+
+    def _size(self, node):
+        return node.size if node is not None else 0
+
+    def _update(self, node):
+        """ Recompute the size of a node and re-link its children. """
+
+        node.size = 1 + self._size(node.left) + self._size(node.right)
+        if node.left is not None:
+            node.left.parent = node
+        if node.right is not None:
+            node.right.parent = node
+
+    def _push(self, node):
+        """ Apply the lazy tags of a node to itself and hand them down
+            to its children.
+        """
+
+        if node.rev:
+            node.left, node.right = node.right, node.left
+            for child in (node.left, node.right):
+                if child is not None:
+                    child.rev = not child.rev
+            node.rev = False
+        if node.neg:
+            node.value = -node.value
+            for child in (node.left, node.right):
+                if child is not None:
+                    child.neg = not child.neg
+            node.neg = False
+
+    def _split(self, node, k):
+        """ Split a subtree into the first k nodes and the rest. """
+
+        if node is None:
+            return None, None
+        self._push(node)
+        if self._size(node.left) >= k:
+            left, node.left = self._split(node.left, k)
+            self._update(node)
+            if left is not None:
+                left.parent = None
+            return left, node
+        else:
+            node.right, right = self._split(
+                node.right, k - self._size(node.left) - 1
+            )
+            self._update(node)
+            if right is not None:
+                right.parent = None
+            return node, right
+
+    def _merge(self, left, right):
+        """ Join two subtrees, every node of left above every node of
+            right in the stack.
+        """
+
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            self._push(left)
+            left.right = self._merge(left.right, right)
+            self._update(left)
+            return left
+        else:
+            self._push(right)
+            right.left = self._merge(left, right.left)
+            self._update(right)
+            return right
+
+    def _node_at(self, pos):
+        """ Walk down from the root to the node at position pos. """
+
+        node = self.root
+        while True:
+            self._push(node)
+            left_size = self._size(node.left)
+            if pos < left_size:
+                node = node.left
+            elif pos == left_size:
+                return node
+            else:
+                pos -= left_size + 1
+                node = node.right
+
+    def _settle(self, node):
+        """ Push every pending tag on the path from the root down to
+            node, so that node.value and the left/right children along
+            the path are correct. Return the position of node.
+        """
+
+        path = []
+        while node is not None:
+            path.append(node)
+            node = node.parent
+        for ancestor in reversed(path):
+            self._push(ancestor)
+
+        # With all tags pushed, the position is the number of nodes
+        # to the left of the path
+        node = path[0]
+        pos = self._size(node.left)
+        for child, ancestor in zip(path, path[1:]):
+            if ancestor.right is child:
+                pos += self._size(ancestor.left) + 1
+        return pos
+
+    # --- Stack operations ---
+    def _apply_to_prefix(self, n_to_flip, reverse, invert):
+        """ Reverse and/or invert the signs of the top n_to_flip
+            pancakes.
+        """
+
+        if n_to_flip <= 0:
+            return
+        top, rest = self._split(self.root, n_to_flip)
+        if reverse:
+            top.rev = not top.rev
+        if invert:
+            top.neg = not top.neg
+        self.root = self._merge(top, rest)
+        self.root.parent = None
+
+    def flip(self, n_to_flip):
+        """ Flip the top n_to_flip pancakes (1-indexed, like
+            Pancake.update). Burnt pancakes also change sign.
+        """
+
+        self._apply_to_prefix(n_to_flip, True, self.burnt)
+
+    def invert_signs(self, n_to_flip):
+        """ Turn the top n_to_flip pancakes over in place, without
+            changing their order.
+        """
+
+        self._apply_to_prefix(n_to_flip, False, True)
+
+    def position(self, pancake):
+        """ Return the 0-indexed position of the pancake of the given
+            size (sign is ignored).
+        """
+
+        return self._settle(self.nodes[abs(pancake)])
+
+    def sign(self, pancake):
+        """ Return +1 if the pancake of the given size is burnt side
+            down, otherwise -1.
+        """
+
+        node = self.nodes[abs(pancake)]
+        self._settle(node)
+        return 1 if node.value > 0 else -1
+
+    def index(self, value):
+        """ Same as list.index: the position of value, sign included. """
+
+        node = self.nodes.get(abs(value))
+        if node is not None:
+            pos = self._settle(node)
+            if node.value == value:
+                return pos
+        raise ValueError(str(value) + " is not in stack")
+
+    def copy(self):
+        return PancakeStack(self.to_list(), self.burnt)
+
+    def to_list(self):
+        """ Return the stack as a plain list, top first. """
+
+        order = []
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            if node is not None:
+                self._push(node)
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                order.append(node.value)
+                node = node.right
+        return order
+
+    # --- List protocol ---
+    def __len__(self):
+        return self._size(self.root)
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return self.to_list()[pos]
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError("stack index out of range")
+        return self._node_at(pos).value
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __contains__(self, value):
+        node = self.nodes.get(abs(value))
+        if node is None:
+            return False
+        self._settle(node)
+        return node.value == value
+
+    def __eq__(self, other):
+        if isinstance(other, (PancakeStack, list, tuple)):
+            return self.to_list() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return "PancakeStack(" + str(self.to_list()) + ", burnt=" + str(self.burnt) + ")"
@@ -0,0 +1,229 @@
+"""
+pancake_store.py
+An on-disk store of solved stacks, so that a stack searched once is
+never searched again, in this process or any other, on this host or (by
+exporting and importing) on another.
+"""
+
+import argparse
+import atexit
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import sqlite3
+import threading
+import time
+
+from pancake_relabel import apply_flips
+
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "solutions.sqlite3")
+BATCH_SIZE = 200        # Solutions held back before writing them together
+FLUSH_INTERVAL = 2.0    # Seconds before held-back solutions are written anyway
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS solutions (
+    stack TEXT NOT NULL,
+    burnt INTEGER NOT NULL,
+    fewest_moves INTEGER NOT NULL,
+    flips TEXT NOT NULL,
+    PRIMARY KEY (stack, burnt)
+) WITHOUT ROWID
+"""
+
+# The statements are fixed strings with parameters, so sqlite3 prepares
+# each once per connection and reuses it from its statement cache
+SELECT_SQL = "SELECT flips FROM solutions WHERE stack = ? AND burnt = ?"
+UPSERT_SQL = """
+INSERT INTO solutions (stack, burnt, fewest_moves, flips) VALUES (?, ?, ?, ?)
+ON CONFLICT (stack, burnt) DO UPDATE SET
+    fewest_moves = excluded.fewest_moves, flips = excluded.flips
+WHERE excluded.fewest_moves < solutions.fewest_moves
+"""
+COUNT_SQL = "SELECT burnt, COUNT(*), MAX(fewest_moves) FROM solutions GROUP BY burnt"
+EXPORT_SQL = "SELECT stack, burnt, flips FROM solutions ORDER BY burnt, stack"
+
+# Stores that are already open, keyed by (process id, path); a forked
+# worker opens its own rather than sharing its parent's connection
+_open_stores = {}
+
+
+# --- Classes ---
+class SolutionStore:
+    """ This class keeps optimal flip sequences in SQLite, keyed by the
+        normalised stack (the vertex key of the stack relabelled so its
+        goal is (1, 2, ..., n)) and the variant.
+        Writes are held back and committed together, every BATCH_SIZE
+        solutions or FLUSH_INTERVAL seconds and on close. The database
+        runs in WAL mode, so many games and solvers can read it while
+        one of them writes. If two answers for a stack arrive, the
+        shorter one is kept.
+    """
+
+    def __init__(self, path=STORE_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = {}           # (stack, burnt) -> flips not yet written
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(SCHEMA)
+
+    def make_key(self, order, burnt):
+        return (":".join([str(i) for i in order]), int(burnt))
+
+    def get(self, order, burnt):
+        """ Return the stored flips for a normalised stack, or None. """
+
+        key = self.make_key(order, burnt)
+        with self.lock:
+            if key in self.pending:
+                return list(self.pending[key])
+            row = self.connection.execute(SELECT_SQL, key).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, order, burnt, flips):
+        """ Remember an optimal flip sequence for a normalised stack. """
+
+        with self.lock:
+            self.pending[self.make_key(order, burnt)] = list(flips)
+            due = (len(self.pending) >= self.batch_size
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """ Write every held-back solution in one transaction. """
+
+        with self.lock:
+            rows = [
+                (stack, burnt, len(flips), json.dumps(flips))
+                for (stack, burnt), flips in self.pending.items()
+            ]
+            self.pending = {}
+            self.last_flush = time.monotonic()
+            if rows:
+                with self.connection:
+                    self.connection.executemany(UPSERT_SQL, rows)
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def counts(self):
+        """ Return {burnt: (stored stacks, longest solution)}. """
+
+        self.flush()
+        return {
+            bool(burnt): (count, longest)
+            for burnt, count, longest in self.connection.execute(COUNT_SQL)
+        }
+
+    def export_file(self, path):
+        """ Write every solution as one JSON object per line and return
+            how many were written.
+        """
+
+        self.flush()
+        written = 0
+        with open(path, "w") as f:
+            for stack, burnt, flips in self.connection.execute(EXPORT_SQL):
+                f.write(json.dumps({"stack": stack, "burnt": bool(burnt), "flips": json.loads(flips)}))
+                f.write("\n")
+                written += 1
+        return written
+
+    def import_file(self, path, batch_size=10000, trusted=False):
+        """ Merge solutions exported by another store, checking that each
+            one really sorts its stack and, unless the file is trusted
+            (say, exported by one of our own hosts), that no shorter
+            sequence does. Proving that can take as long as the searches
+            a warm store is meant to save. Return how many were
+            accepted.
+        """
+
+        # pancake_search reads and writes this store, so it can only be
+        # imported once this module is loaded
+        from pancake_search import is_optimal
+
+        accepted = 0
+        rows = []
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                order = [int(i) for i in record["stack"].split(":")]
+                flips = [int(i) for i in record["flips"]]
+                burnt = bool(record["burnt"])
+                if apply_flips(order, flips, burnt)[-1] != list(range(1, len(order) + 1)):
+                    continue
+                if not trusted and not is_optimal(order, burnt, flips):
+                    continue
+                rows.append(self.make_key(order, burnt) + (len(flips), json.dumps(flips)))
+                accepted += 1
+                if len(rows) >= batch_size:
+                    with self.lock, self.connection:
+                        self.connection.executemany(UPSERT_SQL, rows)
+                    rows = []
+        if rows:
+            with self.lock, self.connection:
+                self.connection.executemany(UPSERT_SQL, rows)
+        return accepted
+
+
+# --- Functions ---
+def open_store(path=None):
+    """ Return this process's store at path (by default PANCAKE_STORE,
+        or data/solutions.sqlite3), opening it the first time. Held-back
+        writes are flushed when the process exits normally. A worker
+        process of a pool skips atexit, so there they are flushed by a
+        multiprocessing finalizer, which runs when the pool is closed
+        and joined (not when it is terminated).
+    """
+
+    path = path or os.environ.get("PANCAKE_STORE", STORE_PATH)
+    key = (os.getpid(), path)
+    if key not in _open_stores:
+        store = SolutionStore(path)
+        if multiprocessing.parent_process() is not None:
+            multiprocessing.util.Finalize(store, store.close, exitpriority=10)
+        else:
+            atexit.register(store.close)
+        _open_stores[key] = store
+    return _open_stores[key]
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="Manage the store of solved stacks.")
+    parser.add_argument("--store", default=None, help="database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="count the stored solutions")
+    export = commands.add_parser("export", help="write every solution to a JSON lines file")
+    export.add_argument("path")
+    merge = commands.add_parser("import", help="merge a JSON lines file into the store")
+    merge.add_argument("path")
+    merge.add_argument("--trusted", action="store_true",
+                       help="only check that each solution sorts its stack, not that it is shortest")
+    args = parser.parse_args()
+
+    store = open_store(args.store)
+    if args.command == "stats":
+        for burnt, (count, longest) in sorted(store.counts().items()):
+            print("burned" if burnt else "regular", count, "stacks, longest", longest, "moves")
+    elif args.command == "export":
+        print(store.export_file(args.path), "solutions exported")
+    else:
+        print(store.import_file(args.path, trusted=args.trusted), "solutions imported")
+
+if __name__ == "__main__":
+    main()
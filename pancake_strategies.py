@@ -0,0 +1,258 @@
+"""
+pancake_strategies.py
+Flipping strategies, and a harness that scores them against optimal
+play over every starting stack (or a stratified sample of them) using a
+pool of processes.
+"""
+
+import argparse
+import multiprocessing
+import random
+
+from pancake_engine import GameEngine
+from pancake_ranking import state_count, unrank
+from pancake_search import gap_heuristic, optimal_flips
+
+
+# --- Strategies ---
+# A strategy takes (current_order, burnt) and returns how many pancakes
+# to flip next, like a player clicking on a pancake.
+def greedy_largest(order, burnt):
+    """ Bring the largest pancake that is not yet in place to the top,
+        then flip it down into place (burnt side down, if burnt).
+    """
+
+    n = len(order)
+    while n and order[n-1] == n:
+        n -= 1
+    position = [abs(i) for i in order].index(n)
+
+    if position > 0:
+        return position + 1
+    if burnt and order[0] > 0:
+        # Turn it over first so that the next flip lands it right way up
+        return 1
+    return n
+
+
+def flip_order(order, n_to_flip, burnt):
+    top = order[n_to_flip-1::-1]
+    if burnt:
+        top = [-i for i in top]
+    return top + order[n_to_flip:]
+
+
+def gap_greedy(order, burnt):
+    """ Make the flip that removes the most gaps (see gap_heuristic),
+        leaving the pancakes already in place at the bottom alone. When
+        no flip removes a gap, or the largest pancake not in place is
+        on top, play greedy_largest instead. Gap flips only ever lower
+        the gap count and greedy flips grow the sorted bottom, so the
+        game always ends.
+    """
+
+    n = len(order)
+    while n and order[n-1] == n:
+        n -= 1
+    if abs(order[0]) == n:
+        return greedy_largest(order, burnt)
+
+    first = 1 if burnt else 2
+    best, best_gaps = None, gap_heuristic(order, burnt)
+    for n_to_flip in range(first, n + 1):
+        new_gaps = gap_heuristic(flip_order(order, n_to_flip, burnt), burnt)
+        if new_gaps < best_gaps:
+            best, best_gaps = n_to_flip, new_gaps
+    if best is None:
+        return greedy_largest(order, burnt)
+    return best
+
+
+class ReplayPolicy:
+    """ This class plays back recorded human moves: for every stack seen
+        in a recorded session it makes the flip the player made there.
+        Unseen stacks are handed to a fallback strategy.
+    """
+
+    def __init__(self, sessions=(), fallback=greedy_largest):
+        self.moves = {}     # (vertex_key, burnt) -> n_to_flip
+        self.fallback = fallback
+        for start_order, burnt, flips in sessions:
+            self.record(start_order, burnt, flips)
+
+    def record(self, start_order, burnt, flips):
+        """ Learn the moves of one session. Later sessions win ties. """
+
+        order = list(start_order)
+        for n_to_flip in flips:
+            self.moves[(":".join([str(i) for i in order]), burnt)] = n_to_flip
+            order = flip_order(order, n_to_flip, burnt)
+
+    def __call__(self, order, burnt):
+        key = (":".join([str(i) for i in order]), burnt)
+        if key in self.moves:
+            return self.moves[key]
+        return self.fallback(order, burnt)
+
+
+STRATEGIES = {
+    "greedy": greedy_largest,
+    "gap-greedy": gap_greedy,
+}
+
+
+# --- Harness ---
+def optimal_distance(order, burnt, use_store=True):
+    """ Exact distance to the sorted stack. """
+
+    return len(optimal_flips(order, burnt, use_store=use_store))
+
+
+def choose_starts(stack_size, burnt, sample=None, seed=0):
+    """ Return the ranks of the starting stacks to evaluate: every stack
+        but the sorted one, or about sample of them spread evenly over
+        equal slices of the rank range (a stratified sample).
+    """
+
+    total = state_count(stack_size, burnt)
+    if sample is None or sample >= total - 1:
+        return list(range(1, total))
+
+    rng = random.Random(seed)
+    strata = min(sample, 1000)
+    starts = []
+    for i in range(strata):
+        low = 1 + (total - 1) * i // strata
+        high = 1 + (total - 1) * (i + 1) // strata
+        count = sample // strata + (1 if i < sample % strata else 0)
+        for j in range(min(count, high - low)):
+            starts.append(rng.randrange(low, high))
+    return sorted(set(starts))
+
+
+def evaluate_start(job):
+    """ Worker: play every strategy from one start and solve it
+        optimally. Return (order, optimum, {name: moves}); a strategy
+        that gives up is reported as None.
+    """
+
+    index, stack_size, burnt, strategies, max_moves, use_store = job
+    order = unrank(index, stack_size, burnt)
+    results = {}
+    for name, strategy in strategies.items():
+        engine = GameEngine(stack_size, burnt, start_order=order)
+        engine.play(strategy, max_moves)
+        results[name] = engine.moves if engine.game_over else None
+    return order, optimal_distance(order, burnt, use_store), results
+
+
+class StrategyReport:
+    """ Running totals for one strategy: the mean and worst ratio of its
+        moves to the optimum, and the mean excess at each distance.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.games = 0
+        self.failures = 0
+        self.total_ratio = 0
+        self.worst_ratio = 0
+        self.worst_order = None
+        self.by_distance = {}   # optimum -> [games, total excess moves]
+
+    def add(self, order, optimum, moves):
+        if moves is None:
+            self.failures += 1
+            return
+        self.games += 1
+        ratio = moves / optimum
+        self.total_ratio += ratio
+        if ratio > self.worst_ratio:
+            self.worst_ratio = ratio
+            self.worst_order = order
+        games_excess = self.by_distance.setdefault(optimum, [0, 0])
+        games_excess[0] += 1
+        games_excess[1] += moves - optimum
+
+    def mean_ratio(self):
+        return self.total_ratio / self.games if self.games else None
+
+    def excess_by_distance(self):
+        """ Return {optimum: (mean excess moves, mean excess ratio)}. """
+
+        return {
+            optimum: (excess / games, excess / games / optimum)
+            for optimum, (games, excess) in sorted(self.by_distance.items())
+        }
+
+    def summary(self):
+        lines = [
+            self.name + ": " + str(self.games) + " games, mean ratio "
+            + format(self.mean_ratio() or 0, ".3f") + ", worst "
+            + format(self.worst_ratio, ".3f") + " on " + str(self.worst_order)
+            + (", " + str(self.failures) + " gave up" if self.failures else "")
+        ]
+        for optimum, (excess, ratio) in self.excess_by_distance().items():
+            lines.append(
+                "    distance " + str(optimum) + ": +" + format(excess, ".2f")
+                + " moves (" + format(100 * ratio, ".1f") + "%)"
+            )
+        return "\n".join(lines)
+
+
+def evaluate(stack_size, burnt, strategies=None, sample=None, processes=None,
+             max_moves=1000, seed=0, use_store=True):
+    """ Score strategies on every start (or a stratified sample) across
+        a process pool. Yield (order, optimum, moves, reports) as each
+        start finishes, so the reports can be shown while it runs.
+        With use_store False the searched optimums are not kept in the
+        solution store.
+    """
+
+    if strategies is None:
+        strategies = STRATEGIES
+    reports = {name: StrategyReport(name) for name in strategies}
+    jobs = [
+        (index, stack_size, burnt, strategies, max_moves, use_store)
+        for index in choose_starts(stack_size, burnt, sample, seed)
+    ]
+
+    with multiprocessing.Pool(processes) as pool:
+        for order, optimum, results in pool.imap_unordered(
+            evaluate_start, jobs, chunksize=64
+        ):
+            for name, moves in results.items():
+                reports[name].add(order, optimum, moves)
+            yield order, optimum, results, reports
+        # Let the workers exit normally, which flushes their stores
+        pool.close()
+        pool.join()
+
+
+# --- Main function ---
+def main():
+    parser = argparse.ArgumentParser(description="Score flipping strategies against optimal play.")
+    parser.add_argument("stack_size", type=int)
+    parser.add_argument("--burnt", action="store_true")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="evaluate a stratified sample instead of every start")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--no-store", action="store_true",
+                        help="do not keep the searched optimums in the solution store")
+    args = parser.parse_args()
+
+    reports = {}
+    for i, (order, optimum, results, reports) in enumerate(
+        evaluate(args.stack_size, args.burnt, sample=args.sample, processes=args.processes,
+                 use_store=not args.no_store)
+    ):
+        if i % 1000 == 999:
+            print(i + 1, "starts:", ", ".join(
+                name + " " + format(report.mean_ratio() or 0, ".3f")
+                for name, report in reports.items()
+            ))
+    for report in reports.values():
+        print(report.summary())
+
+if __name__ == "__main__":
+    main()
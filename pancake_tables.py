@@ -0,0 +1,247 @@
+"""
+pancake_tables.py
+Exact distance tables for every stack of a given size, stored in 2 bits
+per stack so that 12 regular pancakes fit in about 120 MB.
+"""
+
+import mmap
+import os
+
+from pancake_adjacency import neighbor_ranks, open_adjacency
+from pancake_ranking import rank, state_count
+from pancake_relabel import normalise
+from pancake_shared import attach_or_publish, unpublish
+
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tables")
+TABLE_MAGIC = b"PDT2"
+HEADER_SIZE = 8
+UNVISITED = 3
+
+# Largest tables main builds: 12 regular pancakes take about 120 MB and
+# 10 burnt about 930 MB, but 11 burnt would take about 20 GB
+LARGEST_TABLE = {False: 12, True: 10}
+
+# Tables that are already open (or None for a miss), with the mtime of
+# their file when opened: (stack_size, burnt, directory) -> (mtime, table)
+_open_tables = {}
+
+
+# --- Classes ---
+class TwoBitDistanceTable:
+    """ This class stores, for every rank, the distance of that stack to
+        the sorted stack modulo 3, packed four to a byte (3 marks a
+        stack not reached yet).
+        Neighbouring stacks differ in distance by at most one, so the
+        residues of a stack's neighbours tell which of them are one
+        step closer to the goal. Walking downhill that way gives the
+        exact distance and an optimal flip sequence from any stack.
+    """
+
+    def __init__(self, stack_size, burnt, data=None, offset=0, adjacency=None):
+        self.stack_size = stack_size
+        self.burnt = burnt
+        self.size = state_count(stack_size, burnt)
+        self.data = data
+        self.offset = offset    # Start of the packed table within data
+        self.level_counts = []  # Number of stacks at each distance, after build
+        self.adjacency = adjacency  # Optional AdjacencyTable for neighbours
+
+    def get(self, index):
+        byte = self.data[self.offset + (index >> 2)]
+        return (byte >> ((index & 3) << 1)) & 3
+
+    def set(self, index, value):
+        shift = (index & 3) << 1
+        i = self.offset + (index >> 2)
+        self.data[i] = (self.data[i] & ~(3 << shift)) | (value << shift)
+
+    def neighbors(self, index):
+        """ Return [(n_to_flip, rank), ...] for every flip of a rank. """
+
+        return neighbor_ranks(index, self.stack_size, self.burnt, self.adjacency)
+
+    def build(self):
+        """ Breadth First Search outward from the sorted stack, one level
+            at a time, using only the residues for level membership.
+            The stacks whose residue is d % 3 include levels d-3, d-6,
+            ... as well as level d, so a level is grown in whichever
+            direction is cheaper:
+            - top down, expanding every stack with residue d % 3 (the
+              older ones only find visited neighbours), or
+            - bottom up, checking every unvisited stack for a neighbour
+              with residue d % 3 (unvisited stacks are at least d+1
+              away, so only level d can be next to them).
+        """
+
+        self.data = bytearray([255]) * ((self.size + 3) // 4)
+        self.offset = 0
+        self.set(0, 0)
+        self.level_counts = [1]
+        unvisited = self.size - 1
+
+        depth = 0
+        while unvisited:
+            residue = depth % 3
+            next_residue = (depth + 1) % 3
+            same_residue = sum(self.level_counts[residue::3])
+
+            new = 0
+            if same_residue <= unvisited:
+                for index in range(self.size):
+                    if self.get(index) != residue:
+                        continue
+                    for n_to_flip, neighbor in self.neighbors(index):
+                        if self.get(neighbor) == UNVISITED:
+                            self.set(neighbor, next_residue)
+                            new += 1
+            else:
+                for index in range(self.size):
+                    if self.get(index) != UNVISITED:
+                        continue
+                    for n_to_flip, neighbor in self.neighbors(index):
+                        if self.get(neighbor) == residue:
+                            self.set(index, next_residue)
+                            new += 1
+                            break
+
+            if new == 0:
+                break
+            self.level_counts.append(new)
+            unvisited -= new
+            depth += 1
+
+    def distance(self, order):
+        """ Return the exact number of flips from order to the sorted
+            stack by walking downhill.
+        """
+
+        return len(self.solve(order))
+
+    def solve(self, order):
+        """ Return an optimal flip sequence (number of pancakes flipped
+            at each move) from order to the sorted stack.
+        """
+
+        flips = []
+        index = rank(order, self.burnt)
+        value = self.get(index)
+        while index != 0:
+            downhill = (value - 1) % 3
+            for n_to_flip, neighbor in self.neighbors(index):
+                if self.get(neighbor) == downhill:
+                    break
+            flips.append(n_to_flip)
+            index = neighbor
+            value = downhill
+        return flips
+
+    def distance_between(self, start, goal):
+        """ Distance from start to any goal, by relabelling the goal as
+            the sorted stack.
+        """
+
+        return self.distance(normalise(start, goal))
+
+    def filename(self):
+        variant = "burned" if self.burnt else "regular"
+        return variant + "-n" + str(self.stack_size) + ".dist2"
+
+    def save(self, directory=TABLE_DIR):
+        """ Write the table behind an 8-byte header. """
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename())
+        unpublish(path)
+        with open(path, "wb") as f:
+            f.write(TABLE_MAGIC)
+            f.write(bytes([self.stack_size, int(self.burnt), 0, 0]))
+            f.write(self.data[self.offset:self.offset + (self.size + 3) // 4])
+
+    def load(self, directory=TABLE_DIR):
+        """ Map a saved table read-only into memory. The operating
+            system pages it in as it is used and shares the pages
+            between processes. Return False if there is no file.
+        """
+
+        path = os.path.join(directory, self.filename())
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.use(data, path)
+        return True
+
+    def use(self, data, source):
+        """ Read distances from data, a saved table including its
+            header (a file mapping or a shared memory view).
+        """
+
+        if (data[:4] != TABLE_MAGIC or data[4] != self.stack_size
+            or data[5] != int(self.burnt)):
+            raise ValueError(str(source) + " is not a distance table for this stack")
+        self.data = data
+        self.offset = HEADER_SIZE
+
+
+# --- Functions ---
+def open_table(stack_size, burnt, directory=TABLE_DIR, shared=True):
+    """ Return the saved table for this stack size and variant, or None
+        if it has not been built. Tables are opened once per process,
+        and again only if the file appears or changes later (say, built
+        by another process); a miss costs one stat.
+        With shared, the table is attached from shared memory, so it is
+        only held in memory once per machine; the first process to ask
+        for it publishes it there from the file.
+    """
+
+    key = (stack_size, burnt, directory)
+    table = TwoBitDistanceTable(stack_size, burnt)
+    path = os.path.join(directory, table.filename())
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    if key in _open_tables and _open_tables[key][0] == mtime:
+        return _open_tables[key][1]
+
+    if mtime is not None:
+        table.adjacency = open_adjacency(stack_size, burnt)
+        if shared:
+            data = attach_or_publish(path)
+            if data is not None:
+                table.use(data, "shared " + table.filename())
+            else:
+                table = None
+        elif not table.load(directory):
+            table = None
+    else:
+        table = None
+    _open_tables[key] = (mtime, table)
+    return table
+
+
+# --- Main function ---
+def main():
+    """ Build and save the tables, up to LARGEST_TABLE, that are not
+        already on disk. With numpy installed the builds run through
+        the batch kernels, which makes the largest sizes practical.
+    """
+
+    try:
+        from pancake_batch import build_table
+    except ImportError:
+        build_table = TwoBitDistanceTable.build
+
+    for burnt in (False, True):
+        for stack_size in range(1, LARGEST_TABLE[burnt] + 1):
+            table = TwoBitDistanceTable(
+                stack_size, burnt, adjacency=open_adjacency(stack_size, burnt)
+            )
+            if not burnt and stack_size < 2 or table.load():
+                continue
+            build_table(table)
+            table.save()
+            print(table.filename(), "diameter", len(table.level_counts) - 1)
+
+if __name__ == "__main__":
+    main()